@@ -0,0 +1,705 @@
+# -*- coding: utf-8 -*-
+"""
+Interfaz Tk del generador de etiquetas 51×25 mm (controles +/−, vista previa, cuadrícula
+del catálogo y generación en segundo plano). El motor (lectura, PDF, raster, ZPL) está en
+gui_generate_barcode.py, que se importa sin tkinter para la CLI y el servidor.
+
+    python app_generate_barcode.py
+"""
+
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+import logging, os, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import ImageTk
+
+from gui_generate_barcode import (
+    LABEL_W_MM, LABEL_H_MM, PREVIEW_SCALE,
+    NAME_FONT_SIZE_DEFAULT, SKU_FONT_SIZE_DEFAULT, CODE_TEXT_SIZE_DEFAULT,
+    BARCODE_HEIGHT_MM_DEFAULT, BARCODE_WIDTH_MM_DEFAULT, BARCODE_MODES, BARCODE_MODE_DEFAULT,
+    MARGIN_TOP_MM_DEFAULT, MARGIN_BOTTOM_MM_DEFAULT, MARGIN_LEFT_MM_DEFAULT, MARGIN_RIGHT_MM_DEFAULT,
+    LINE_SPACING_MM_DEFAULT, SKU_SPACING_MM_DEFAULT, TITLE_SKU_SPACE_MM_DEFAULT,
+    TITLE_MAX_W_MM_DEFAULT, SKU_MAX_W_MM_DEFAULT, FIT_MIN_FONT_PT, SHEET_SIZES_MM,
+    LabelSettings, SheetLayout, LabelColumns, LabelCache, LRUCache, GenerationCancelled,
+    norm_col, map_columns, read_any, label_columns, register_reportlab_font, build_preview_image,
+    text_widths_pt, text_overflow, fit_record, fit_report_path, preflight_report_path,
+    run_generation, _image_nbytes,
+)
+
+# ================== UI: control +/− grande ==================
+class PlusMinus(tk.Frame):
+    """
+    Control numérico con Entry centrado y botones +/- grandes (ttk).
+    """
+    def __init__(self, parent, label, var: tk.DoubleVar, minv, maxv, step, on_change=None):
+        super().__init__(parent, bg="#0e1a34")
+        self.var, self.minv, self.maxv, self.step = var, float(minv), float(maxv), float(step)
+        self.on_change = on_change
+
+        ttk.Label(self, text=label).grid(row=0, column=0, columnspan=3, sticky="w")
+
+        self.btn_minus = ttk.Button(self, text="−", style="Big.TButton", command=self.dec, width=2)
+        self.btn_plus  = ttk.Button(self, text="+", style="Big.TButton", command=self.inc, width=2)
+        self.entry = tk.Entry(self, textvariable=self.var, justify="right",
+                              font=("Segoe UI", 11), width=8, relief="solid",
+                              bg="#0f172a", fg="#e5e7eb", insertbackground="#e5e7eb")
+
+        self.btn_minus.grid(row=1, column=0, padx=(0,8), pady=2)
+        self.entry.grid(row=1, column=1, padx=8, pady=2)
+        self.btn_plus.grid(row=1, column=2, padx=(8,0), pady=2)
+
+        self.entry.bind("<Return>", lambda e: self._clamp_and_fire())
+        self.entry.bind("<FocusOut>", lambda e: self._clamp_and_fire())
+
+    def _clamp_and_fire(self):
+        try: v=float(self.var.get())
+        except Exception: v=self.minv
+        v=max(self.minv, min(self.maxv, v))
+        self.var.set(round(v, 3))
+        if self.on_change: self.on_change()
+
+    def inc(self):
+        try: v=float(self.var.get())
+        except Exception: v=self.minv
+        v=min(self.maxv, v+self.step)
+        self.var.set(round(v,3))
+        if self.on_change: self.on_change()
+
+    def dec(self):
+        try: v=float(self.var.get())
+        except Exception: v=self.minv
+        v=max(self.minv, v-self.step)
+        self.var.set(round(v,3))
+        if self.on_change: self.on_change()
+
+# ================== UI: vista previa en segundo plano ==================
+class PreviewScheduler:
+    """
+    Vista previa sin bloquear Tk: request() agrupa ráfagas de cambios (debounce),
+    el render corre en un hilo de fondo y los resultados viejos se descartan.
+    prepare() se llama en el hilo principal (lee variables Tk) y devuelve el trabajo;
+    render(trabajo) corre en el hilo de fondo; on_result(resultado) vuelve al principal.
+    """
+    POLL_MS = 25
+
+    def __init__(self, widget, prepare, render, on_result, delay_ms=120):
+        self.widget, self.prepare, self.render, self.on_result = widget, prepare, render, on_result
+        self.delay_ms = delay_ms
+        self._after = None; self._gen = 0; self._polling = False
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self._results = queue.Queue()
+
+    def request(self):
+        """Pide una vista previa; los pedidos dentro de delay_ms se agrupan en uno."""
+        if self._after is not None: self.widget.after_cancel(self._after)
+        self._after = self.widget.after(self.delay_ms, self._fire)
+
+    def _fire(self):
+        self._after = None
+        try: job = self.prepare()
+        except Exception: return          # valores a medio escribir, sin CSV, etc.
+        self.submit(job)
+
+    def submit(self, job):
+        """Renderiza `job` ya preparado, sin esperar el debounce."""
+        self._gen += 1
+        self._pool.submit(self._run, self._gen, job)
+        if not self._polling:
+            self._polling = True; self.widget.after(self.POLL_MS, self._poll)
+
+    def _run(self, gen, job):
+        if gen != self._gen: return                       # ya hay un pedido más nuevo
+        try: self._results.put((gen, self.render(job), None))
+        except Exception as e: self._results.put((gen, None, e))
+
+    def _poll(self):
+        latest = None
+        try:
+            while True: latest = self._results.get_nowait()
+        except queue.Empty: pass
+        if latest is not None and latest[0] == self._gen:
+            if latest[2] is None: self.on_result(latest[1])
+            self._polling = False; return
+        self.widget.after(self.POLL_MS, self._poll)
+
+    def shutdown(self):
+        self._gen += 1
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+# ================== UI: cuadrícula de vista previa ==================
+GRID_SCALE = 4                 # px por mm de las miniaturas (204×100 px)
+GRID_GAP_PX = 10
+GRID_CAPTION_PX = 16           # alto del rótulo "fila N" bajo cada miniatura
+GRID_OVERSCAN_ROWS = 2         # filas de miniaturas que se preparan fuera de la vista
+GRID_CACHE_MB = 64             # miniaturas ya dibujadas (≈ 60 KB c/u)
+
+class PreviewGrid(tk.Frame):
+    """
+    Miniaturas de muchas etiquetas con scroll virtual: el Canvas mide lo que mediría el
+    catálogo completo, pero solo existen ítems para las filas visibles (más
+    GRID_OVERSCAN_ROWS); al salir de la vista se borran con su PhotoImage. Las imágenes se
+    dibujan en un pool de hilos con render(fila, scale) y quedan en un LRU acotado por bytes,
+    con clave (key, fila): set_source() con otra key (diseño nuevo) invalida lo anterior sin
+    tirar la caché, y los renders en curso de una generación vieja se descartan.
+    """
+    POLL_MS = 30
+
+    def __init__(self, parent, on_open=None, workers=2, scale=GRID_SCALE, cache_mb=GRID_CACHE_MB):
+        super().__init__(parent, bg="#0e1a34")
+        self.on_open, self.scale = on_open, scale
+        self.tile_w, self.tile_h = int(LABEL_W_MM*scale), int(LABEL_H_MM*scale)
+        self.cell_w = self.tile_w + GRID_GAP_PX
+        self.cell_h = self.tile_h + GRID_CAPTION_PX + GRID_GAP_PX
+        self.cache = LRUCache(max_items=1 << 20, max_bytes=cache_mb << 20, sizeof=_image_nbytes)
+
+        self.canvas = tk.Canvas(self, bg="#0b1220", highlightthickness=1, highlightbackground="#334155",
+                                yscrollincrement=max(1, self.cell_h // 4))
+        self.vbar = ttk.Scrollbar(self, orient="vertical", command=self._yview)
+        self.canvas.configure(yscrollcommand=self.vbar.set)
+        self.vbar.pack(side="right", fill="y"); self.canvas.pack(side="left", fill="both", expand=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grid")
+        self._results = queue.Queue()
+        self._rows = np.arange(0); self._marks = None
+        self._render = None; self._key = None; self._gen = 0
+        self._cols = 1; self._items = {}           # posición → PhotoImage (o None mientras se dibuja)
+        self._wanted = frozenset(); self._inflight = 0
+        self._polling = False; self._update_id = None
+
+        self.canvas.bind("<Configure>", lambda e: self._relayout())
+        self.canvas.bind("<Button-1>", self._click)
+        self.canvas.bind("<Enter>", lambda e: self._bind_wheel(True))
+        self.canvas.bind("<Leave>", lambda e: self._bind_wheel(False))
+
+    # ---------- datos ----------
+    def set_source(self, rows, render, key, marks=None):
+        """
+        rows: filas del catálogo a mostrar, en orden; render(fila, scale) → PIL.Image;
+        key: firma de los datos y del diseño; marks: máscara por fila del catálogo (no cabe).
+        """
+        rows = np.asarray(rows)
+        if key is not None and key == self._key and np.array_equal(rows, self._rows): return
+        self._rows, self._render, self._key, self._marks = rows, render, key, marks
+        self._gen += 1
+        self._relayout()
+
+    def clear(self):
+        self.set_source(np.arange(0), None, None)
+        self.cache.clear()
+
+    def shutdown(self):
+        self._gen += 1
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- scroll ----------
+    def _yview(self, *args):
+        self.canvas.yview(*args); self._schedule_update()
+
+    def _bind_wheel(self, on):
+        if not on:
+            for ev in ("<MouseWheel>", "<Button-4>", "<Button-5>"): self.canvas.unbind_all(ev)
+            return
+        self.canvas.bind_all("<MouseWheel>", lambda e: self._wheel(-1 if e.delta > 0 else 1))
+        self.canvas.bind_all("<Button-4>", lambda e: self._wheel(-1))
+        self.canvas.bind_all("<Button-5>", lambda e: self._wheel(1))
+
+    def _wheel(self, direction):
+        self.canvas.yview_scroll(direction * 2, "units"); self._schedule_update()
+
+    def _schedule_update(self):
+        # varios eventos de scroll por cuadro → un solo _update
+        if self._update_id is None: self._update_id = self.after_idle(self._update)
+
+    def _relayout(self):
+        self.canvas.delete("all"); self._items.clear()
+        self._cols = max(1, (self.canvas.winfo_width() - GRID_GAP_PX) // self.cell_w)
+        n_rows = -(-len(self._rows) // self._cols)
+        self.canvas.configure(scrollregion=(0, 0, self._cols * self.cell_w + GRID_GAP_PX,
+                                            n_rows * self.cell_h + GRID_GAP_PX))
+        self._update()
+
+    def _cell_xy(self, pos):
+        r, c = divmod(pos, self._cols)
+        return GRID_GAP_PX + c * self.cell_w, GRID_GAP_PX + r * self.cell_h
+
+    def _click(self, e):
+        x, y = self.canvas.canvasx(e.x) - GRID_GAP_PX, self.canvas.canvasy(e.y) - GRID_GAP_PX
+        c, r = int(x // self.cell_w), int(y // self.cell_h)
+        pos = r * self._cols + c
+        if self.on_open and 0 <= c < self._cols and 0 <= pos < len(self._rows):
+            self.on_open(int(self._rows[pos]))
+
+    # ---------- virtualización ----------
+    def _update(self):
+        if self._update_id is not None: self.after_cancel(self._update_id); self._update_id = None
+        top = self.canvas.canvasy(0)
+        r0 = max(0, int((top - GRID_GAP_PX) // self.cell_h) - GRID_OVERSCAN_ROWS)
+        r1 = int((top + self.canvas.winfo_height()) // self.cell_h) + GRID_OVERSCAN_ROWS
+        want = range(r0 * self._cols, min(len(self._rows), (r1 + 1) * self._cols))
+        self._wanted = frozenset(want)
+        for pos in [p for p in self._items if p not in self._wanted]:
+            self.canvas.delete(f"p{pos}"); del self._items[pos]
+        for pos in want:
+            if pos not in self._items: self._place(pos)
+
+    def _place(self, pos):
+        row = int(self._rows[pos]); x, y = self._cell_xy(pos); tag = f"p{pos}"
+        bad = self._marks is not None and bool(self._marks[row])
+        self.canvas.create_rectangle(x, y, x + self.tile_w, y + self.tile_h, fill="#1e293b", outline="", tags=tag)
+        self.canvas.create_text(x, y + self.tile_h + 2, anchor="nw", tags=tag, font=("Segoe UI", 8),
+                                text=f"fila {row + 1}" + (" · no cabe" if bad else ""),
+                                fill="#fca5a5" if bad else "#94a3b8")
+        if bad:
+            self.canvas.create_rectangle(x - 1, y - 1, x + self.tile_w, y + self.tile_h, outline="#ef4444",
+                                         width=2, tags=(tag, f"o{pos}"))
+        self._items[pos] = None
+        img = self.cache.get((self._key, row))
+        if img is not None: self._show(pos, img)
+        elif self._render is not None:
+            self._inflight += 1
+            self._pool.submit(self._run, self._gen, self._render, self._key, row, pos)
+            if not self._polling:
+                self._polling = True; self.after(self.POLL_MS, self._poll)
+
+    def _run(self, gen, render, key, row, pos):
+        # hilo de fondo: se saltea si el diseño cambió o la miniatura ya salió de la vista
+        if gen != self._gen or pos not in self._wanted:
+            return self._results.put((gen, pos, None, True))
+        img = self.cache.get((key, row))
+        if img is None:
+            try: img = render(row, self.scale); self.cache.put((key, row), img)
+            except Exception: logging.exception("Vista previa de la fila %d", row + 1)
+        self._results.put((gen, pos, img, False))
+
+    def _poll(self):
+        while True:
+            try: gen, pos, img, skipped = self._results.get_nowait()
+            except queue.Empty: break
+            self._inflight -= 1
+            if gen != self._gen or pos not in self._items: continue
+            if img is not None: self._show(pos, img)
+            elif skipped:
+                # salteado en el hilo por un scroll que ya se deshizo: volver a pedirla
+                self.canvas.delete(f"p{pos}"); del self._items[pos]; self._place(pos)
+        if self._inflight > 0: self.after(self.POLL_MS, self._poll)
+        else: self._polling = False
+
+    def _show(self, pos, img):
+        if self._items.get(pos) is not None: return      # ya dibujada (pedido duplicado)
+        photo = ImageTk.PhotoImage(img)
+        self._items[pos] = photo
+        x, y = self._cell_xy(pos)
+        self.canvas.create_image(x, y, anchor="nw", image=photo, tags=f"p{pos}")
+        self.canvas.tag_raise(f"o{pos}")
+
+# ================== APP ==================
+class App(tk.Tk):
+    # "Medir" → (stats, profile) de run_generation; el resultado queda en el .log / junto al PDF
+    DIAGNOSTICS = {"No": (False, None), "Etapas": (True, None),
+                   "cProfile": (True, "cprofile"), "Muestreo": (True, "sampling")}
+    # "Códigos" → modo de preflight_barcodes
+    BARCODE_CHECKS = {"Informar": "report", "Corregir dígito": "repair", "Omitir filas": "reject", "No revisar": "off"}
+
+    def __init__(self):
+        super().__init__()
+        self.title("Etiquetas 51x25 mm – PRO+ (Single-line)")
+        self.geometry("1120x760")
+        self.configure(bg="#0b1220")
+
+        style = ttk.Style(self)
+        try: style.theme_use("clam")
+        except Exception: pass
+        style.configure("Dark.TFrame", background="#0b1220")
+        style.configure("Card.TFrame", background="#0e1a34")
+        style.configure("TLabel", background="#0e1a34", foreground="#e5e7eb", font=("Segoe UI", 10))
+        style.configure("TCheckbutton", background="#0e1a34", foreground="#e5e7eb", font=("Segoe UI", 10))
+        style.configure("Header.TLabel", background="#0b1220", foreground="#93c5fd", font=("Segoe UI Semibold", 13))
+        style.configure("TButton", background="#1d4ed8", foreground="white", padding=8)
+        style.map("TButton", background=[("active","#2563eb")])
+        style.configure("Big.TButton", font=("Segoe UI", 12), padding=6)
+
+        # Vars
+        self.csv_path = tk.StringVar()
+        self.out_folder = tk.StringVar(value=str(Path.cwd()))
+        self.out_filename = tk.StringVar(value="etiquetas_51x25mm.pdf")
+        self.col_nombre = tk.StringVar(); self.col_sku = tk.StringVar()
+        self.col_barcode = tk.StringVar(); self.col_cantidad = tk.StringVar()
+
+        self.name_fs = tk.DoubleVar(value=NAME_FONT_SIZE_DEFAULT)
+        self.sku_fs  = tk.DoubleVar(value=SKU_FONT_SIZE_DEFAULT)
+        self.code_fs = tk.DoubleVar(value=CODE_TEXT_SIZE_DEFAULT)
+        self.bar_h   = tk.DoubleVar(value=BARCODE_HEIGHT_MM_DEFAULT)
+        self.bar_w   = tk.DoubleVar(value=BARCODE_WIDTH_MM_DEFAULT)
+
+        self.m_left  = tk.DoubleVar(value=MARGIN_LEFT_MM_DEFAULT)
+        self.m_right = tk.DoubleVar(value=MARGIN_RIGHT_MM_DEFAULT)
+        self.m_top   = tk.DoubleVar(value=MARGIN_TOP_MM_DEFAULT)
+        self.m_bottom= tk.DoubleVar(value=MARGIN_BOTTOM_MM_DEFAULT)
+
+        self.line_spacing = tk.DoubleVar(value=LINE_SPACING_MM_DEFAULT)
+        self.title_sku_space = tk.DoubleVar(value=TITLE_SKU_SPACE_MM_DEFAULT)
+        self.sku_spacing  = tk.DoubleVar(value=SKU_SPACING_MM_DEFAULT)
+
+        self.title_max_w = tk.DoubleVar(value=TITLE_MAX_W_MM_DEFAULT)  # sin uso actual
+        self.sku_max_w   = tk.DoubleVar(value=SKU_MAX_W_MM_DEFAULT)    # sin uso actual
+
+        self.bar_mode = tk.StringVar(value=BARCODE_MODE_DEFAULT)
+        self.workers  = tk.DoubleVar(value=1)
+        self.sheet_page  = tk.StringVar(value="Etiqueta")     # "Etiqueta" = una por página
+        self.sheet_start = tk.DoubleVar(value=0)
+        self.diagnostics = tk.StringVar(value="No")        # ver DIAGNOSTICS
+        self.auto_fit   = tk.BooleanVar(value=False)        # tamaño de título/SKU por etiqueta (fit_label_text)
+        self.fit_min_fs = tk.DoubleVar(value=FIT_MIN_FONT_PT)
+        self.barcode_check = tk.StringVar(value="Informar")   # ver BARCODE_CHECKS
+        self.use_cache  = tk.BooleanVar(value=False)        # LabelCache en CACHE_DIR_DEFAULT
+        self.grid_only_bad = tk.BooleanVar(value=False)     # cuadrícula: solo filas que no caben
+        self.preview_title = tk.StringVar(value="Vista previa (1 etiqueta):")
+        self.grid_info = tk.StringVar(value="")
+
+        self.df_cached=None; self._df_tried=set(); self.preview_photo=None; self.preview_row=0
+        self._catalog_key=None; self._catalog=None; self._catalog_widths=None
+        self.gen_thread=None; self.gen_cancel=None; self.gen_events=queue.Queue()
+
+        self.build_ui()
+        self.preview_scheduler = PreviewScheduler(
+            self, self._preview_job, lambda job: build_preview_image(job[0], **job[1]), self._show_preview)
+
+        for v in (self.name_fs,self.sku_fs,self.code_fs,self.bar_h,self.bar_w,
+                  self.m_left,self.m_right,self.m_top,self.m_bottom,
+                  self.line_spacing,self.title_sku_space,self.sku_spacing,
+                  self.title_max_w,self.sku_max_w):
+            v.trace_add("write", lambda *a: self._safe_preview())
+
+    def build_ui(self):
+        root = ttk.Frame(self, style="Dark.TFrame"); root.pack(fill="both", expand=True, padx=16, pady=16)
+        ttk.Label(root, text="Generador de Etiquetas 51×25 mm", style="Header.TLabel").pack(anchor="w", pady=(0,8))
+
+        top = ttk.Frame(root, style="Card.TFrame"); top.pack(fill="x", pady=8, ipady=6, ipadx=6)
+
+        f1 = ttk.Frame(top, style="Card.TFrame"); f1.pack(fill="x", pady=6, padx=8)
+        ttk.Label(f1, text="CSV:").pack(side="left", padx=(0,8))
+        ttk.Entry(f1, textvariable=self.csv_path, width=62).pack(side="left", padx=(0,8))
+        ttk.Button(f1, text="Elegir archivo", command=self.choose_csv).pack(side="left")
+        ttk.Label(f1, text="Carpeta destino:").pack(side="left", padx=(16,8))
+        ttk.Entry(f1, textvariable=self.out_folder, width=42).pack(side="left", padx=(0,8))
+        ttk.Button(f1, text="Seleccionar", command=self.choose_folder).pack(side="left")
+
+        f2 = ttk.Frame(top, style="Card.TFrame"); f2.pack(fill="x", pady=6, padx=8)
+        ttk.Label(f2, text="Nombre PDF:").pack(side="left", padx=(0,8))
+        ttk.Entry(f2, textvariable=self.out_filename, width=32).pack(side="left", padx=(0,8))
+        ttk.Button(f2, text="Autodetectar columnas", command=self.autodetect).pack(side="left", padx=(16,0))
+
+        f3 = ttk.Frame(top, style="Card.TFrame"); f3.pack(fill="x", pady=6, padx=8)
+        for label, var in [("Columna Nombre", self.col_nombre),
+                           ("SKU", self.col_sku),
+                           ("Código", self.col_barcode),
+                           ("Cantidad", self.col_cantidad)]:
+            cell = ttk.Frame(f3, style="Card.TFrame"); cell.pack(side="left", padx=(0,16))
+            ttk.Label(cell, text=label+":").pack(anchor="w")
+            ttk.Entry(cell, textvariable=var, width=22).pack(anchor="w")
+
+        f4 = ttk.Frame(top, style="Card.TFrame"); f4.pack(fill="x", pady=8, padx=8)
+        for lbl,var,a,b,st in [
+            ("Letra NOMBRE (pt)", self.name_fs, 6, 16, 0.5),
+            ("Letra SKU (pt)",    self.sku_fs,  5, 14, 0.5),
+            ("Letra CÓDIGO (pt)", self.code_fs, 6, 16, 0.5),
+            ("Altura Código (mm)",self.bar_h,   5, 14, 0.5),
+            ("Ancho Código (mm)", self.bar_w,   20, 50,0.5),
+        ]:
+            PlusMinus(f4, lbl, var, a, b, st, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+
+        f5 = ttk.Frame(top, style="Card.TFrame"); f5.pack(fill="x", pady=8, padx=8)
+        for lbl,var,a,b,st in [
+            ("Margen Izq (mm)", self.m_left, 0, 10, 0.5),
+            ("Margen Der (mm)", self.m_right,0, 10, 0.5),
+            ("Margen Arriba (mm)", self.m_top,0, 10, 0.5),
+            ("Margen Abajo (mm)",  self.m_bottom,0,10, 0.5),
+        ]:
+            PlusMinus(f5, lbl, var, a, b, st, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+
+        f6 = ttk.Frame(top, style="Card.TFrame"); f6.pack(fill="x", pady=8, padx=8)
+        PlusMinus(f6, "Espacio entre líneas Título (mm)", self.line_spacing, 2.0, 6.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+        PlusMinus(f6, "Espacio Título ↔ SKU (mm)", self.title_sku_space, 0.0, 6.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+        PlusMinus(f6, "Espacio después del SKU (mm)", self.sku_spacing, 0.0, 8.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+
+        # (Se mantienen por si en el futuro reactivas el ajuste por ancho)
+        f7 = ttk.Frame(top, style="Card.TFrame"); f7.pack(fill="x", pady=8, padx=8)
+        PlusMinus(f7, "Ancho TÍTULO (mm)", self.title_max_w, 20.0, 50.0, 0.5, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+        PlusMinus(f7, "Ancho SKU (mm)",    self.sku_max_w,   20.0, 50.0, 0.5, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+        ttk.Checkbutton(f7, text="Autoajustar título/SKU", variable=self.auto_fit,
+                        command=self._safe_preview).pack(side="left", padx=(0,18))
+        PlusMinus(f7, "Letra mínima (pt)", self.fit_min_fs, 3, 10, 0.5, on_change=self._safe_preview).pack(side="left", padx=(0,18))
+        ttk.Label(f7, text="Códigos inválidos:").pack(side="left", padx=(0,8))
+        ttk.Combobox(f7, textvariable=self.barcode_check, values=tuple(self.BARCODE_CHECKS),
+                     state="readonly", width=14).pack(side="left")
+
+        actions = ttk.Frame(top, style="Card.TFrame"); actions.pack(fill="x", pady=10, padx=8)
+        ttk.Button(actions, text="Generar Vista Previa", command=self.preview).pack(side="left")
+        self.btn_generate = ttk.Button(actions, text="Generar PDF", command=self.generate)
+        self.btn_generate.pack(side="left", padx=8)
+        self.btn_cancel = ttk.Button(actions, text="Cancelar", command=self.cancel_generation, state="disabled")
+        self.btn_cancel.pack(side="left")
+        ttk.Label(actions, text="Código en PDF:").pack(side="left", padx=(16,8))
+        ttk.Combobox(actions, textvariable=self.bar_mode, values=BARCODE_MODES,
+                     state="readonly", width=8).pack(side="left")
+        PlusMinus(actions, "Procesos PDF", self.workers, 1, os.cpu_count() or 1, 1).pack(side="left", padx=(16,0))
+        ttk.Label(actions, text="Hoja:").pack(side="left", padx=(16,8))
+        ttk.Combobox(actions, textvariable=self.sheet_page, values=("Etiqueta", *SHEET_SIZES_MM),
+                     state="readonly", width=9).pack(side="left")
+        PlusMinus(actions, "Celda inicial", self.sheet_start, 0, 99, 1).pack(side="left", padx=(16,0))
+        ttk.Label(actions, text="Medir:").pack(side="left", padx=(16,8))
+        ttk.Combobox(actions, textvariable=self.diagnostics, values=tuple(self.DIAGNOSTICS),
+                     state="readonly", width=9).pack(side="left")
+        ttk.Checkbutton(actions, text="Reutilizar etiquetas (caché)", variable=self.use_cache).pack(side="left", padx=(16,0))
+
+        preview_card = ttk.Frame(root, style="Card.TFrame"); preview_card.pack(fill="both", expand=True, pady=8, ipady=8, ipadx=8)
+        single = ttk.Frame(preview_card, style="Card.TFrame"); single.pack(side="left", fill="y", padx=(0,12))
+        ttk.Label(single, textvariable=self.preview_title).pack(anchor="w")
+        self.preview_canvas = tk.Canvas(single,
+                                        width=int(LABEL_W_MM*PREVIEW_SCALE),
+                                        height=int(LABEL_H_MM*PREVIEW_SCALE),
+                                        bg="#0b1220", highlightthickness=1, highlightbackground="#334155")
+        self.preview_canvas.pack(pady=10)
+
+        # Cuadrícula: miniaturas de todo el catálogo (clic → vista grande de esa fila)
+        many = ttk.Frame(preview_card, style="Card.TFrame"); many.pack(side="left", fill="both", expand=True)
+        head = ttk.Frame(many, style="Card.TFrame"); head.pack(fill="x")
+        ttk.Label(head, text="Catálogo:").pack(side="left")
+        ttk.Label(head, textvariable=self.grid_info).pack(side="left", padx=(8,16))
+        ttk.Checkbutton(head, text="Solo las que no caben", variable=self.grid_only_bad,
+                        command=self._safe_preview).pack(side="left")
+        self.preview_grid = PreviewGrid(many, on_open=self.open_row)
+        self.preview_grid.pack(fill="both", expand=True, pady=(6,0))
+
+        self.status = tk.StringVar(value="Listo. Ajusta con +/− y genera vista previa.")
+        ttk.Label(root, textvariable=self.status, style="Header.TLabel").pack(anchor="w", pady=(8,0))
+        self.progress = ttk.Progressbar(root, mode="determinate", maximum=1)
+        self.progress.pack(fill="x", pady=(4,0))
+
+    # ---------- lógica ----------
+    def settings(self) -> LabelSettings:
+        return LabelSettings(
+            name_fs=self.name_fs.get(), sku_fs=self.sku_fs.get(), code_fs=self.code_fs.get(),
+            bar_h_mm=self.bar_h.get(), bar_w_mm=self.bar_w.get(),
+            m_left_mm=self.m_left.get(), m_right_mm=self.m_right.get(),
+            m_top_mm=self.m_top.get(),   m_bottom_mm=self.m_bottom.get(),
+            line_spacing_mm=self.line_spacing.get(),
+            title_sku_space_mm=self.title_sku_space.get(),
+            sku_spacing_mm=self.sku_spacing.get(),
+            title_max_w_mm=self.title_max_w.get(),
+            sku_max_w_mm=self.sku_max_w.get(),
+            bar_mode=self.bar_mode.get())
+
+    def sheet_layout(self):
+        if self.sheet_page.get() not in SHEET_SIZES_MM: return None
+        return SheetLayout(page=self.sheet_page.get(), start=int(self.sheet_start.get()))
+
+    def column_overrides(self) -> dict:
+        return {"nombre":self.col_nombre.get() or None, "sku":self.col_sku.get() or None,
+                "barcode":self.col_barcode.get() or None, "cantidad":self.col_cantidad.get() or None}
+
+    def _safe_preview(self):
+        self.preview_scheduler.request()
+
+    def destroy(self):
+        self.preview_scheduler.shutdown(); self.preview_grid.shutdown()
+        super().destroy()
+
+    def choose_csv(self):
+        p = filedialog.askopenfilename(title="Seleccionar archivo", filetypes=[
+            ("Tablas", "*.csv *.parquet *.xlsx *.xlsm *.jsonl *.ndjson"), ("CSV","*.csv"),
+            ("Parquet","*.parquet"), ("Excel","*.xlsx *.xlsm"), ("JSON Lines","*.jsonl *.ndjson"), ("Todos","*.*")])
+        if p:
+            self.csv_path.set(p)
+            self._df_tried = set()
+            try: self.df_cached = read_any(Path(p), self.column_overrides()); self.status.set("Archivo cargado. Puedes autodetectar columnas.")
+            except Exception as e: messagebox.showerror("Error", f"No se pudo leer el CSV:\n{e}"); return
+            self.preview_grid.clear(); self._safe_preview()
+
+    def choose_folder(self):
+        f = filedialog.askdirectory(title="Seleccionar carpeta destino")
+        if f: self.out_folder.set(f)
+
+    def autodetect(self):
+        if not self.csv_path.get(): messagebox.showwarning("Falta CSV","Primero elige un archivo CSV."); return
+        try:
+            mapping, _ = self.get_mapping_df(); df = self.df_cached
+            rev = {norm_col(c):c for c in df.columns}
+            self.col_nombre.set(rev.get(mapping.get("nombre",""),""))
+            self.col_sku.set(rev.get(mapping.get("sku",""),""))
+            self.col_barcode.set(rev.get(mapping.get("barcode",""),""))
+            self.col_cantidad.set(rev.get(mapping.get("cantidad",""),""))
+            self.status.set("Columnas autodetectadas.")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo autodetectar:\n{e}")
+
+    def get_mapping_df(self):
+        if not self.csv_path.get(): raise RuntimeError("Selecciona primero un CSV.")
+        overrides = self.column_overrides()
+        # df_cached trae solo las columnas candidatas: si se elige otra a mano, se vuelve a leer
+        have = set() if self.df_cached is None else {norm_col(c) for c in self.df_cached.columns}
+        missing = {norm_col(v) for v in overrides.values() if v} - have - self._df_tried
+        if self.df_cached is None or missing:
+            self._df_tried |= missing
+            self.df_cached = read_any(Path(self.csv_path.get()), overrides)
+        return map_columns(self.df_cached, overrides)
+
+    def catalog(self) -> LabelColumns:
+        """
+        Registros de todo el CSV (una entrada por fila), cacheados hasta que cambie el CSV o
+        las columnas elegidas (evita re-mapear todo el DataFrame en cada ajuste de la vista previa).
+        """
+        key = (self.csv_path.get(), id(self.df_cached), tuple(sorted(self.column_overrides().items())))
+        if key != self._catalog_key:
+            mapping, df = self.get_mapping_df()
+            self._catalog = label_columns(df, mapping)
+            self._catalog_key, self._catalog_widths, self.preview_row = key, None, 0
+        return self._catalog
+
+    def preview_record(self):
+        """Registro de la fila elegida en la cuadrícula (la primera por defecto)."""
+        labels = self.catalog()
+        if labels.rows == 0: return None
+        self.preview_row = min(self.preview_row, labels.rows - 1)
+        return labels.record(self.preview_row)
+
+    def _preview_job(self):
+        rec = self.preview_record()
+        if rec is None: raise ValueError("El archivo CSV no tiene filas.")
+        st = self.settings()
+        if self.auto_fit.get(): rec = fit_record(rec, st, register_reportlab_font(), self.fit_min_fs.get())
+        self._refresh_grid(st)
+        return rec, st.layout()
+
+    def _refresh_grid(self, st: LabelSettings):
+        """Pasa el catálogo y el diseño actual a la cuadrícula; solo re-dibuja lo visible."""
+        labels = self.catalog()
+        base_font = register_reportlab_font()
+        min_fs = self.fit_min_fs.get() if self.auto_fit.get() else None
+        if self._catalog_widths is None:      # anchos a 1 pt: se miden una vez por catálogo
+            self._catalog_widths = (text_widths_pt(labels.nombre, base_font), text_widths_pt(labels.sku, base_font))
+        bad = text_overflow(labels, st, base_font, min_fs, self._catalog_widths)
+        rows = np.flatnonzero(bad) if self.grid_only_bad.get() else np.arange(labels.rows)
+        layout = st.layout()
+
+        def render(i, scale):
+            rec = labels.record(i)
+            if min_fs is not None: rec = fit_record(rec, st, base_font, min_fs)
+            return build_preview_image(rec, scale=scale, **layout)
+
+        key = (self._catalog_key, tuple(sorted(layout.items())), min_fs)
+        self.preview_grid.set_source(rows, render, key, bad)
+        self.grid_info.set(f"{labels.rows:,} filas · {int(bad.sum()):,} no caben")
+
+    def open_row(self, row):
+        self.preview_row = row
+        self.preview_scheduler.submit(self._preview_job())
+
+    def preview(self):
+        if self.preview_record() is None:
+            messagebox.showwarning("CSV vacío","El archivo CSV no tiene filas."); return
+        self.preview_scheduler.submit(self._preview_job())
+
+    def _show_preview(self, img):
+        self.preview_photo = ImageTk.PhotoImage(img)
+        self.preview_canvas.delete("all")
+        self.preview_canvas.create_image(0,0,anchor="nw", image=self.preview_photo)
+        self.preview_title.set(f"Vista previa (fila {self.preview_row + 1}):")
+        self.status.set("Vista previa actualizada.")
+
+    def generate(self):
+        """Lanza la generación en un hilo aparte; el avance llega por self.gen_events."""
+        if self.gen_thread is not None: return
+        if not self.out_folder.get():
+            messagebox.showwarning("Falta carpeta","Selecciona una carpeta destino."); return
+        if not self.csv_path.get():
+            messagebox.showerror("Error", "Ocurrió un error:\nSelecciona primero un CSV."); return
+        out_path = str(Path(self.out_folder.get()) / (self.out_filename.get() or "etiquetas_51x25mm.pdf"))
+        log_path = Path(out_path).with_suffix(".log")
+        try: self.get_mapping_df()          # carga las columnas elegidas a mano que falten
+        except Exception as e: messagebox.showerror("Error", f"No se pudo leer el archivo:\n{e}"); return
+        source = self.df_cached
+        sheet = self.sheet_layout()
+        try: sheet and sheet.grid()
+        except ValueError as e: messagebox.showerror("Hoja", str(e)); return
+        args = (out_path, log_path, source, self.column_overrides(), self.settings(),
+                int(self.workers.get()), sheet, *self.DIAGNOSTICS[self.diagnostics.get()],
+                self.fit_min_fs.get() if self.auto_fit.get() else None, self.BARCODE_CHECKS[self.barcode_check.get()],
+                LabelCache() if self.use_cache.get() else None)
+
+        self.gen_cancel = threading.Event()
+        self.gen_thread = threading.Thread(target=self._generate_worker, args=args, daemon=True)
+        self.btn_generate.configure(state="disabled"); self.btn_cancel.configure(state="normal")
+        self.progress.configure(value=0)
+        self.status.set("Generando…")
+        self.gen_thread.start()
+        self.after(100, self._poll_generation)
+
+    def cancel_generation(self):
+        if self.gen_cancel is not None:
+            self.gen_cancel.set(); self.status.set("Cancelando…")
+
+    def _generate_worker(self, out_path, log_path, source, overrides, settings, workers, sheet, measure, profile, fit_min_fs,
+                         barcode_check, cache):
+        # Hilo de fondo: no toca Tk, solo publica eventos en self.gen_events.
+        handler = logging.FileHandler(log_path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        root = logging.getLogger(); root.addHandler(handler); root.setLevel(logging.INFO)
+        try:
+            stats = run_generation(out_path, source, overrides, settings, workers=workers, sheet=sheet,
+                                   progress=lambda *p: self.gen_events.put(("progress", *p)),
+                                   cancel=self.gen_cancel, stats=measure, profile=profile,
+                                   auto_fit=fit_min_fs is not None, fit_min_fs=fit_min_fs or FIT_MIN_FONT_PT,
+                                   barcode_check=barcode_check, cache=cache)
+            self.gen_events.put(("done", out_path, log_path, stats))
+        except GenerationCancelled:
+            logging.info("Generación cancelada: %s (no se escribió el PDF)", out_path)
+            self.gen_events.put(("cancelled",))
+        except Exception as e:
+            logging.exception("Error en la generación")
+            self.gen_events.put(("error", e))
+        finally:
+            root.removeHandler(handler); handler.close()
+
+    def _poll_generation(self):
+        while True:
+            try: ev = self.gen_events.get_nowait()
+            except queue.Empty: break
+            kind = ev[0]
+            if kind == "progress":
+                _, done, total, rate, eta = ev
+                self.progress.configure(maximum=max(1, total or 1), value=done)
+                eta_txt = f" · faltan {eta:,.0f} s" if eta is not None else ""
+                self.status.set(f"Generando… {done:,}/{total:,} etiquetas · {rate:,.0f} etiquetas/s{eta_txt}")
+                continue
+            self.gen_thread = None; self.gen_cancel = None
+            self.btn_generate.configure(state="normal"); self.btn_cancel.configure(state="disabled")
+            if kind == "done":
+                _, out_path, log_path, stats = ev
+                extra = (f"\n\n{stats['no_caben']:,} filas no caben ni con la letra mínima:\n"
+                         f"{fit_report_path(out_path)}") if stats["no_caben"] else ""
+                if stats["codigos_rechazados"]:
+                    extra += (f"\n\n{stats['codigos_rechazados']:,} filas con códigos inválidos:\n"
+                              f"{preflight_report_path(out_path)}")
+                messagebox.showinfo("Éxito", f"PDF generado:\n{out_path}\nLog:\n{log_path}{extra}")
+                self.status.set(f"PDF generado correctamente: {stats['labels']:,} etiquetas en "
+                                f"{stats['seconds']:.1f} s.")
+            elif kind == "cancelled":
+                self.progress.configure(value=0)
+                self.status.set("Generación cancelada. No se escribió el PDF.")
+            else:
+                messagebox.showerror("Error", f"Ocurrió un error:\n{ev[1]}")
+                self.status.set("Error en la generación.")
+            return
+        self.after(100, self._poll_generation)
+
+
+def main() -> int:
+    App().mainloop()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark del flujo de etiquetas con CSV sintéticos reproducibles.
+
+Mide por separado cada etapa (leer el CSV completo y solo las columnas mapeadas,
+autodetectar columnas, armar registros,
+imagen y PNG del código, draw_label_pdf en modo vector y raster, vista previa) y la
+generación completa de punta a punta. Reporta etiquetas/s, pico de memoria asignada
+por etapa (tracemalloc) y bytes/etiqueta; los resultados se guardan en JSON para comparar corridas y marcar
+regresiones (por ejemplo tras actualizar reportlab o Pillow).
+
+Uso:
+    python bench_generate_barcode.py --rows 5000 --qty 1-3 --code128 0.2 --save base.json
+    python bench_generate_barcode.py --rows 5000 --qty 1-3 --code128 0.2 --compare base.json
+"""
+
+import argparse, functools, io, json, logging, os, platform, random, sys, tempfile, time, tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import PIL
+import reportlab
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas as pdf_canvas
+
+import gui_generate_barcode as gbc
+
+TOLERANCE_DEFAULT = 0.10     # caída de etiquetas/s tolerada antes de marcar regresión
+
+def ean13_checksum(base12: str) -> str:
+    s = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(base12))
+    return str((10 - s % 10) % 10)
+
+def _random_code(rnd, code128: bool) -> str:
+    if code128:     # cualquier largo distinto de 13 dígitos sale como Code128
+        return "".join(rnd.choice("0123456789") for _ in range(rnd.choice((8, 10, 12, 14))))
+    base = "".join(rnd.choice("0123456789") for _ in range(12))
+    return base + ean13_checksum(base)
+
+def parse_qty(spec: str):
+    """'3' → siempre 3 copias; '1-5' → uniforme entre 1 y 5."""
+    lo, _, hi = str(spec).partition("-")
+    lo = int(lo); hi = int(hi or lo)
+    if lo < 1 or hi < lo: raise ValueError(f"Cantidad inválida: {spec!r}")
+    return lo, hi
+
+def synthetic_labels(n: int, seed=0, code128=0.0):
+    rnd = random.Random(seed)
+    return [{"nombre": f"Producto de prueba {i}", "sku": f"SKU-{i:06d}",
+             "barcode": _random_code(rnd, rnd.random() < code128)} for i in range(n)]
+
+def write_synthetic_csv(path, rows: int, seed=0, qty="1", code128=0.0):
+    """
+    CSV con encabezados "de cliente" y columnas extra. El nombre y el código no están en
+    CANDIDATES, así map_columns pasa por las heurísticas (búsqueda de códigos por
+    contenido y columna de texto más larga) en lugar de solo renombrar.
+    """
+    rnd = random.Random(seed)
+    lo, hi = parse_qty(qty)
+    labels = synthetic_labels(rows, seed, code128)
+    df = pd.DataFrame({
+        "Descripción larga": [r["nombre"] for r in labels],
+        "SKU": [r["sku"] for r in labels],
+        "Código EAN-13": [r["barcode"] for r in labels],
+        "Cantidad": [rnd.randint(lo, hi) for _ in labels],
+        "Precio": [round(rnd.uniform(1, 999), 2) for _ in labels],
+        "Notas": ["x" * 16] * rows,
+    })
+    df.to_csv(path, index=False, encoding="utf-8")
+    return path
+
+def peak_alloc_mb(fn, setup=lambda: None):
+    """
+    Pico de memoria (MB) que reserva una corrida de fn(), medido con tracemalloc desde
+    cero: es propio de la etapa, no el pico acumulado del proceso. Cuenta lo asignado
+    desde Python y numpy en este proceso (no los procesos de --workers).
+    """
+    setup()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1 << 20)
+    finally:
+        tracemalloc.stop()
+
+def clear_caches():
+    for cache in (gbc.BARCODE_PATTERN_CACHE, gbc.BARCODE_IMAGE_CACHE, gbc.BARCODE_PNG_CACHE):
+        cache.clear()
+
+def measure(stage, fn, items, out_bytes=None, repeat=1, setup=clear_caches, mem=True):
+    """
+    Ejecuta fn() `repeat` veces (setup() antes de cada una, en frío) y se queda con la
+    más rápida. Con mem, una corrida más bajo tracemalloc (aparte, porque lo hace más
+    lento) da el pico de memoria. Devuelve (resultado, fila de resultados de la etapa).
+    """
+    dt = float("inf")
+    for _ in range(max(1, repeat)):
+        setup()
+        t0 = time.perf_counter()
+        result = fn()
+        dt = min(dt, time.perf_counter() - t0)
+    row = {"stage": stage, "items": items, "seconds": dt,
+           "items_per_s": items / dt if dt else None,
+           "peak_alloc_mb": peak_alloc_mb(fn, setup) if mem else None}
+    if out_bytes is not None:
+        row["bytes_per_item"] = (out_bytes(result) if callable(out_bytes) else out_bytes) / items if items else 0.0
+    return result, row
+
+def bench_mode(labels, bar_mode, base_font="Helvetica"):
+    """draw_label_pdf sin Form XObjects, para medir el costo real por etiqueta."""
+    W, H = gbc.LABEL_W_MM*mm, gbc.LABEL_H_MM*mm
+    buf = io.BytesIO()
+    c = pdf_canvas.Canvas(buf, pagesize=(W, H))
+    for rec in labels:
+        gbc.draw_label_pdf(c, W, H, rec, base_font=base_font, bar_mode=bar_mode)
+        c.showPage()
+    c.save()
+    return len(buf.getvalue())
+
+def run_suite(args, workdir: Path):
+    rows = []
+    timed = functools.partial(measure, repeat=args.repeat, mem=not args.no_mem)
+    csv_path = write_synthetic_csv(workdir / "bench.csv", args.rows, args.seed, args.qty, args.code128)
+    st = gbc.LabelSettings()
+    layout = st.layout()
+    base_font = gbc.register_reportlab_font()
+    px_w, px_h = int(st.bar_w_mm * 300 / 25.4), int(st.bar_h_mm * 300 / 25.4)
+
+    df, r = timed("read_any", lambda: gbc.read_any(csv_path), args.rows); rows.append(r)
+    _, r = timed("read_table", lambda: gbc.read_table(csv_path, {}), args.rows); rows.append(r)
+    (mapping, df), r = timed("map_columns", lambda: gbc.map_columns(df, {}), args.rows); rows.append(r)
+    labels, r = timed("build_labels", lambda: gbc.build_labels(df, mapping), args.rows); rows.append(r)
+
+    sample = labels[:args.sample]
+    codes = [rec["barcode"] for rec in sample]
+    _, r = timed("make_barcode_image", lambda: [gbc.make_barcode_image(c, px_w, px_h) for c in codes],
+                   len(codes)); rows.append(r)
+    _, r = timed("barcode_png_bytes", lambda: [gbc.barcode_png_bytes(c, st.bar_w_mm, st.bar_h_mm) for c in codes],
+                   len(codes), out_bytes=lambda pngs: sum(map(len, pngs))); rows.append(r)
+    for mode in gbc.BARCODE_MODES:
+        _, r = timed(f"draw_label_pdf[{mode}]", lambda: bench_mode(sample, mode, base_font),
+                       len(sample), out_bytes=lambda n: n); rows.append(r)
+    _, r = timed("build_preview_image", lambda: [gbc.build_preview_image(rec, **layout) for rec in sample],
+                   len(sample)); rows.append(r)
+
+    out_pdf = workdir / "bench.pdf"
+    stats, r = timed("end_to_end", lambda: gbc.run_generation(str(out_pdf), csv_path, {}, st, workers=args.workers),
+                       len(labels), out_bytes=lambda _: out_pdf.stat().st_size); rows.append(r)
+    r["stages"] = stats["stages"]
+    return rows
+
+def compare(rows, baseline: dict, tolerance: float):
+    """Etapas cuyo items/s cayó más que `tolerance` respecto a la corrida base."""
+    base = {r["stage"]: r for r in baseline.get("results", [])}
+    out = []
+    for r in rows:
+        b = base.get(r["stage"])
+        if not b or not b.get("items_per_s") or not r.get("items_per_s"): continue
+        ratio = r["items_per_s"] / b["items_per_s"]
+        r["vs_base"] = ratio
+        if ratio < 1.0 - tolerance: out.append((r["stage"], b["items_per_s"], r["items_per_s"], ratio))
+    return out
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "reportlab": reportlab.Version, "pillow": PIL.__version__,
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+def print_table(rows):
+    print(f"{'etapa':<26} {'items':>8} {'seg':>8} {'items/s':>11} {'bytes/item':>11} {'alloc MB':>8} {'vs base':>8}")
+    for r in rows:
+        ips = f"{r['items_per_s']:.1f}" if r["items_per_s"] else "-"
+        bpi = f"{r['bytes_per_item']:.0f}" if "bytes_per_item" in r else ""
+        mem = f"{r['peak_alloc_mb']:.1f}" if r.get("peak_alloc_mb") is not None else "-"
+        vs = f"{r['vs_base']:.2f}x" if "vs_base" in r else ""
+        print(f"{r['stage']:<26} {r['items']:>8} {r['seconds']:>8.3f} {ips:>11} {bpi:>11} {mem:>8} {vs:>8}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark del flujo de etiquetas (CSV → PDF)")
+    ap.add_argument("--rows", type=int, default=2000, help="filas del CSV sintético")
+    ap.add_argument("--qty", default="1", help="copias por fila: N o rango A-B (uniforme)")
+    ap.add_argument("--code128", type=float, default=0.0, help="fracción de códigos Code128 (resto EAN-13)")
+    ap.add_argument("--sample", type=int, default=500, help="etiquetas para las etapas de código, PDF y vista previa")
+    ap.add_argument("--workers", type=int, default=1, help="procesos para la generación completa")
+    ap.add_argument("--repeat", type=int, default=3, help="repeticiones por etapa (se toma la más rápida)")
+    ap.add_argument("--no-mem", action="store_true", help="no medir memoria (se ahorra una corrida con tracemalloc por etapa)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", type=Path, help="guardar resultados en este JSON")
+    ap.add_argument("--compare", type=Path, help="JSON de una corrida anterior para detectar regresiones")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE_DEFAULT,
+                    help="caída relativa de items/s tolerada (0.10 = 10%%)")
+    args = ap.parse_args(argv)
+    if not 0.0 <= args.code128 <= 1.0: ap.error("--code128 debe estar entre 0 y 1")
+    try: parse_qty(args.qty)
+    except ValueError as e: ap.error(str(e))
+
+    logging.basicConfig(level=logging.ERROR)    # avisos de la generación (p. ej. GTIN como Code128) fuera de la tabla
+    with tempfile.TemporaryDirectory(prefix="bench_etiquetas_") as tmp:
+        rows = run_suite(args, Path(tmp))
+
+    regressions = []
+    if args.compare:
+        regressions = compare(rows, json.loads(args.compare.read_text(encoding="utf-8")), args.tolerance)
+    print_table(rows)
+
+    if args.save:
+        params = {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+        doc = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "params": params,
+               "environment": environment(), "results": rows}
+        args.save.write_text(json.dumps(doc, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nResultados guardados en {args.save}")
+
+    if regressions:
+        print(f"\nRegresiones (más de {args.tolerance:.0%} por debajo de {args.compare}):")
+        for stage, before, now, ratio in regressions:
+            print(f"  {stage}: {before:.1f} → {now:.1f} items/s ({ratio:.2f}x)")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
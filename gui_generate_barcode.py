@@ -5,18 +5,33 @@ GUI PRO+ (azul oscuro) – Etiquetas 51×25 mm desde CSV
 • Título y SKU: UNA SOLA LÍNEA (sin "…" ni salto a 2 líneas)
 • Tú ajustas tamaños hasta que quepan
 • Botones +/- grandes (mejor UX) con estilo ttk
+• Motor y CLI sin tkinter; los widgets Tk están en app_generate_barcode.py
 
 Requisitos:
-    pip install reportlab pandas pillow python-barcode
+    pip install reportlab pandas numpy pillow python-barcode
 """
 
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import logging, re, io
+if __name__ == "__main__":
+    # Como script no se ejecuta el motor aquí: se delega en el módulo importado, así la
+    # interfaz, la CLI y los procesos del pool usan una sola copia (FONTS, STATS, cachés).
+    import sys
+    if len(sys.argv) > 1:
+        import gui_generate_barcode
+        sys.exit(gui_generate_barcode.main())
+    import app_generate_barcode         # Tk solo para la interfaz: la CLI y el servidor no lo necesitan
+    sys.exit(app_generate_barcode.main())
+
+import logging, re, io, os, sys, time, argparse, threading, functools, itertools, contextlib, socket, weakref, bisect, hashlib, zlib, struct
+from dataclasses import dataclass, asdict, fields, replace
+from collections import OrderedDict, deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+import reportlab
 from pathlib import Path
 
+import codecs
+import numpy as np
 import pandas as pd
-from PIL import Image, ImageDraw, ImageFont, ImageTk, Image
+from PIL import Image, ImageDraw, ImageFont
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas as pdf_canvas
 from reportlab.pdfbase import pdfmetrics
@@ -44,10 +59,104 @@ LINE_SPACING_MM_DEFAULT = 3.4       # distancia entre línea del título y la si
 TITLE_SKU_SPACE_MM_DEFAULT = 0.8    # espacio vertical entre título y SKU
 SKU_SPACING_MM_DEFAULT  = 0.0       # espacio después del SKU (antes del código)
 
+# Código de barras en PDF: "vector" (barras como rectángulos) o "raster" (PNG 300 dpi)
+BARCODE_MODES = ("vector", "raster")
+BARCODE_MODE_DEFAULT = "vector"
+BARCODE_QUIET_MODULES = 11          # zona silenciosa a cada lado (≈ 2.0 mm / 0.18 mm del render raster)
+
+# Autoajuste de título/SKU por etiqueta
+FIT_MIN_FONT_PT = 5.0               # tamaño mínimo de título/SKU
+FIT_STEP_PT = 0.1                   # los tamaños se redondean hacia abajo a este paso
+
 # (Se mantienen por compatibilidad aunque ahora no se usan para envolver texto)
 TITLE_MAX_W_MM_DEFAULT = 45.0
 SKU_MAX_W_MM_DEFAULT   = 45.0
 
+# ================== Ajustes de diseño ==================
+@dataclass
+class LabelSettings:
+    """
+    Parámetros de diseño de la etiqueta (los mismos de build_preview_image / draw_label_pdf).
+    """
+    name_fs: float = NAME_FONT_SIZE_DEFAULT
+    sku_fs: float = SKU_FONT_SIZE_DEFAULT
+    code_fs: float = CODE_TEXT_SIZE_DEFAULT
+    bar_h_mm: float = BARCODE_HEIGHT_MM_DEFAULT
+    bar_w_mm: float = BARCODE_WIDTH_MM_DEFAULT
+    m_left_mm: float = MARGIN_LEFT_MM_DEFAULT
+    m_right_mm: float = MARGIN_RIGHT_MM_DEFAULT
+    m_top_mm: float = MARGIN_TOP_MM_DEFAULT
+    m_bottom_mm: float = MARGIN_BOTTOM_MM_DEFAULT
+    line_spacing_mm: float = LINE_SPACING_MM_DEFAULT
+    title_sku_space_mm: float = TITLE_SKU_SPACE_MM_DEFAULT
+    sku_spacing_mm: float = SKU_SPACING_MM_DEFAULT
+    title_max_w_mm: float = TITLE_MAX_W_MM_DEFAULT
+    sku_max_w_mm: float = SKU_MAX_W_MM_DEFAULT
+    bar_mode: str = BARCODE_MODE_DEFAULT
+
+    def layout(self) -> dict:
+        """kwargs de build_preview_image."""
+        d = asdict(self); d.pop("bar_mode"); return d
+
+    def pdf_params(self, base_font="Helvetica") -> dict:
+        """kwargs de draw_label_pdf / draw_label_form / generate_pdf."""
+        return dict(asdict(self), base_font=base_font)
+
+SHEET_SIZES_MM = {"A4": (210.0, 297.0), "Carta": (215.9, 279.4)}
+
+@dataclass
+class SheetLayout:
+    """
+    Imposición de varias etiquetas por hoja, en cuadrícula (fila por fila desde arriba
+    a la izquierda). rows/cols = 0 calcula cuántas caben. Los offsets van desde la
+    esquina superior izquierda de la hoja hasta la primera etiqueta; start = celdas ya
+    usadas de la primera hoja (hojas empezadas).
+    """
+    page: str = "A4"                # "A4", "Carta" o "ANCHOxALTO" en mm
+    rows: int = 0
+    cols: int = 0
+    gutter_x_mm: float = 2.0
+    gutter_y_mm: float = 2.0
+    offset_x_mm: float = 5.0
+    offset_y_mm: float = 5.0
+    start: int = 0
+
+    def page_size_mm(self):
+        if self.page in SHEET_SIZES_MM: return SHEET_SIZES_MM[self.page]
+        m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*[xX×]\s*(\d+(?:\.\d+)?)", str(self.page).strip())
+        if not m:
+            raise ValueError(f"Hoja desconocida {self.page!r}: use {', '.join(SHEET_SIZES_MM)} o ANCHOxALTO en mm (p. ej. 100x150).")
+        w, h = float(m.group(1)), float(m.group(2))
+        if w <= 0 or h <= 0: raise ValueError(f"Hoja {self.page!r}: el ancho y el alto deben ser mayores que 0.")
+        return w, h
+
+    def grid(self):
+        pw, ph = self.page_size_mm()
+        fit = lambda avail, size, gap: int((avail + gap) // (size + gap)) if avail >= size else 0
+        rows = self.rows or fit(ph - self.offset_y_mm, LABEL_H_MM, self.gutter_y_mm)
+        cols = self.cols or fit(pw - self.offset_x_mm, LABEL_W_MM, self.gutter_x_mm)
+        if rows < 1 or cols < 1: raise ValueError(f"La etiqueta no cabe en la hoja {self.page}.")
+        span = lambda n, size, gap, off: off + n * size + (n - 1) * gap
+        if span(cols, LABEL_W_MM, self.gutter_x_mm, self.offset_x_mm) > pw + 1e-6:
+            raise ValueError(f"{cols} columnas no caben a lo ancho de la hoja {self.page} ({pw:g} mm).")
+        if span(rows, LABEL_H_MM, self.gutter_y_mm, self.offset_y_mm) > ph + 1e-6:
+            raise ValueError(f"{rows} filas no caben a lo alto de la hoja {self.page} ({ph:g} mm).")
+        if not 0 <= self.start < rows * cols:
+            raise ValueError(f"Celda inicial {self.start} fuera de la hoja: hay {rows * cols} celdas (0 a {rows * cols - 1}).")
+        return rows, cols
+
+    def per_sheet(self) -> int:
+        rows, cols = self.grid(); return rows * cols
+
+    def cell_origin(self, i: int):
+        """Esquina inferior izquierda (pt) de la celda i de la hoja."""
+        _, cols = self.grid()
+        r, c = divmod(i, cols)
+        _, ph = self.page_size_mm()
+        x = self.offset_x_mm + c * (LABEL_W_MM + self.gutter_x_mm)
+        y = ph - self.offset_y_mm - r * (LABEL_H_MM + self.gutter_y_mm) - LABEL_H_MM
+        return x*mm, y*mm
+
 # --------- Columnas candidatas ---------
 CANDIDATES = {
     "nombre":  ["nombre","name","titulo","producto","descripcion","descripcion_corta"],
@@ -56,15 +165,174 @@ CANDIDATES = {
     "cantidad":["cantifad","cantidad","qty","cantidad_de_etiquetas","num_etiquetas"]
 }
 
+AUTODETECT_ROWS    = 2000     # filas de muestra para autodetectar columnas
+STREAM_CSV_ROWS    = 50_000   # filas por bloque al leer el archivo en modo streaming
+
+# ================== Instrumentación ==================
+class StageStats:
+    """
+    Tiempos y contadores por etapa del flujo (leer CSV, registros, código, PDF…).
+    Desactivado (por defecto) una función instrumentada solo paga un `if`; activado
+    guarda por etapa llamadas, total, máximo y un histograma de duraciones.
+    """
+    BUCKETS_US = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+    BUCKET_LABELS = ("<10µs", "<100µs", "<1ms", "<10ms", "<100ms", "<1s", "≥1s")
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stages = {}      # etapa -> [llamadas, total_s, máx_s, *cubetas]
+        self._counters = Counter()
+
+    def reset(self, enabled=None):
+        with self._lock:
+            self._stages.clear(); self._counters.clear()
+            if enabled is not None: self.enabled = enabled
+
+    def add(self, stage, seconds):
+        i = bisect.bisect_left(self.BUCKETS_US, seconds * 1e6)
+        with self._lock:
+            row = self._stages.get(stage)
+            if row is None: row = self._stages[stage] = [0, 0.0, 0.0] + [0] * len(self.BUCKET_LABELS)
+            row[0] += 1; row[1] += seconds; row[2] = max(row[2], seconds); row[3 + i] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock: self._counters[name] += n
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        if not self.enabled:
+            yield; return
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.add(stage, time.perf_counter() - t0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"stages": {k: list(v) for k, v in self._stages.items()}, "counters": dict(self._counters)}
+
+    def merge(self, snap: dict):
+        """Suma lo medido en otro proceso (ver _render_chunk_pdf)."""
+        with self._lock:
+            for stage, other in snap["stages"].items():
+                row = self._stages.setdefault(stage, [0, 0.0, 0.0] + [0] * len(self.BUCKET_LABELS))
+                row[2] = max(row[2], other[2])
+                for i in (0, 1, *range(3, len(row))): row[i] += other[i]
+            self._counters.update(snap["counters"])
+
+    def report(self) -> str:
+        head = f"{'etapa':<20} {'llamadas':>9} {'total s':>9} {'media ms':>9} {'máx ms':>9}  " + \
+               " ".join(f"{b:>7}" for b in self.BUCKET_LABELS)
+        lines = [head]
+        for stage, row in sorted(self._stages.items(), key=lambda kv: -kv[1][1]):
+            n, tot, mx = row[:3]
+            lines.append(f"{stage:<20} {n:>9,} {tot:>9.3f} {tot/n*1e3:>9.3f} {mx*1e3:>9.3f}  " +
+                         " ".join(f"{c:>7,}" for c in row[3:]))
+        if self._counters:
+            lines.append("contadores: " + ", ".join(f"{k}={v:,}" for k, v in sorted(self._counters.items())))
+        return "\n".join(lines)
+
+STATS = StageStats()
+
+def instrumented(stage: str):
+    """Decorador: cuenta y cronometra cada llamada en STATS[stage] cuando está activo."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not STATS.enabled: return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: STATS.add(stage, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+class _StackSampler(threading.Thread):
+    """
+    Perfilador por muestreo sin dependencias: cada `interval` s toma la pila del hilo
+    observado (sys._current_frames) y cuenta pilas plegadas "módulo:función;…",
+    el formato que leen flamegraph.pl y speedscope.
+    """
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True, name="muestreo-perfil")
+        self.thread_id, self.interval = thread_id, interval
+        self.samples = Counter()
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack: self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._halt.set(); self.join()
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common(): f.write(f"{stack} {n}\n")
+
+PROFILERS = ("cprofile", "sampling")
+
+@contextlib.contextmanager
+def instrumentation(out_path, *, stats=False, profile=None):
+    """
+    stats=True activa STATS durante el bloque y al salir deja el histograma por etapa
+    en el log. profile ("cprofile" o "sampling") perfila el hilo actual y guarda el
+    perfil junto a out_path: <salida>.prof (pstats, snakeviz) o <salida>.stacks.txt
+    (pilas plegadas). Los procesos de --workers no se perfilan, solo se suman sus STATS.
+    """
+    if profile not in (None, *PROFILERS): raise ValueError(f"Perfilador desconocido: {profile!r}")
+    with contextlib.ExitStack() as stack:
+        if stats:
+            STATS.reset(enabled=True)
+            def _log_stats():
+                STATS.enabled = False
+                logging.info("Etapas instrumentadas:\n%s", STATS.report())
+            stack.callback(_log_stats)
+        if profile == "cprofile":
+            import cProfile
+            prof, prof_path = cProfile.Profile(), Path(out_path).with_suffix(".prof")
+            stack.callback(lambda: (prof.disable(), prof.dump_stats(prof_path),
+                                    logging.info("Perfil cProfile: %s", prof_path)))
+            prof.enable()
+        elif profile == "sampling":
+            sampler, prof_path = _StackSampler(threading.get_ident()), Path(out_path).with_suffix(".stacks.txt")
+            stack.callback(lambda: (sampler.stop(), sampler.dump(prof_path),
+                                    logging.info("Perfil por muestreo: %s (%d muestras)", prof_path,
+                                                 sum(sampler.samples.values()))))
+            sampler.start()
+        yield
+
 # ================== Utilidades CSV/columnas ==================
 def norm_col(s): return re.sub(r"[^a-z0-9]+","_", s.strip().lower())
 
-def read_csv_any(p: Path):
-    try: return pd.read_csv(p, encoding="utf-8")
-    except Exception: return pd.read_csv(p, encoding="latin-1")
-
-def map_columns(df: pd.DataFrame, overrides: dict):
+def sniff_encoding(p: Path, sample_bytes=1 << 20) -> str:
+    """
+    "utf-8-sig" / "utf-8" si la muestra inicial decodifica como UTF-8, si no "latin-1".
+    Evita leer el archivo completo dos veces para descubrir la codificación.
+    """
+    with open(p, "rb") as f: head = f.read(sample_bytes)
+    if head.startswith(b"\xef\xbb\xbf"): return "utf-8-sig"
+    try: codecs.getincrementaldecoder("utf-8")().decode(head, final=False); return "utf-8"
+    except UnicodeDecodeError: return "latin-1"
+
+def _is_text_column(s: pd.Series) -> bool:
+    """Texto y no números guardados como texto (vale para object, str y columnas leídas con dtype=str)."""
+    if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s): return False
+    v = s.dropna()
+    return len(v) > 0 and pd.to_numeric(v.astype(str), errors="coerce").isna().mean() > 0.5
+
+def map_columns(df: pd.DataFrame, overrides: dict, sample_rows=AUTODETECT_ROWS):
+    """
+    overrides > nombres de CANDIDATES > heurísticas por contenido; las heurísticas miran
+    solo las primeras sample_rows filas.
+    """
     df = df.rename(columns={c:norm_col(c) for c in df.columns})
+    sample = df.iloc[:sample_rows]
     mapping = {}
     for k,v in overrides.items():
         if v: mapping[k] = norm_col(v)
@@ -76,8 +344,8 @@ def map_columns(df: pd.DataFrame, overrides: dict):
                 mapping[t] = norm_col(o); break
 
     if "barcode" not in mapping:
-        for c in df.columns:
-            s = df[c].astype(str).str.replace(r"\D","", regex=True)
+        for c in sample.columns:
+            s = sample[c].astype(str).str.replace(r"\D","", regex=True)
             if s.str.fullmatch(r"\d{12,14}").fillna(False).mean() > 0.5:
                 mapping["barcode"] = c; break
     if "sku" not in mapping:
@@ -85,29 +353,452 @@ def map_columns(df: pd.DataFrame, overrides: dict):
             if "sku" in c or "modelo" in c or "referencia" in c:
                 mapping["sku"]=c; break
     if "nombre" not in mapping:
-        txt=[(df[c].astype(str).str.len().mean(), c) for c in df.columns if df[c].dtype==object]
+        txt=[(sample[c].astype(str).str.len().mean(), c) for c in sample.columns if _is_text_column(sample[c])]
         if txt: mapping["nombre"]=sorted(txt,reverse=True)[0][1]
     if "cantidad" not in mapping:
         df["_cantidad_default"]=1; mapping["cantidad"]="_cantidad_default"
     return mapping, df
 
+# ================== Lectura de archivos (CSV, Parquet, Excel, JSON Lines) ==================
+def _cell_text(v) -> str:
+    return str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+
+
+def _text_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas como texto para formatos con tipos (Parquet, JSON): enteros tal cual y floats
+    enteros sin ".0" (un EAN con celdas vacías llega como float: 7501234567895.0), también
+    dentro de columnas mixtas (object), nulos como NaN, igual que un CSV leído con dtype=str.
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_float_dtype(s) and np.all(np.mod(s.dropna().to_numpy(), 1) == 0):
+            s = s.astype("Int64")
+        if not pd.api.types.is_string_dtype(s) or pd.api.types.is_object_dtype(s):
+            s = s.astype(object).where(s.notna(), np.nan)
+            s = s.map(_cell_text, na_action="ignore")
+        out[str(c)] = s
+    return pd.DataFrame(out, index=df.index)
+
+class TableReader:
+    """
+    Lector de un formato de entrada. Todo se lee como texto: un EAN largo no pasa por
+    float y no se paga la inferencia de tipos de columnas que no se van a usar.
+    sample(n) → primeras n filas con todas las columnas (para autodetectar);
+    read(usecols) → archivo completo, solo esas columnas (None = todas);
+    chunks(usecols, rows) → lo mismo por bloques. Los formatos se registran en READERS.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def sample(self, n) -> pd.DataFrame: raise NotImplementedError
+
+    def read(self, usecols=None) -> pd.DataFrame: raise NotImplementedError
+
+    def chunks(self, usecols, rows):
+        """Por defecto el formato no se puede leer por partes: se lee y se rebana."""
+        df = self.read(usecols)
+        for i in range(0, len(df), rows): yield df.iloc[i:i+rows]
+
+class CsvReader(TableReader):
+    def __init__(self, path):
+        super().__init__(path)
+        self.encoding = sniff_encoding(self.path)
+
+    def _read_csv(self, **kw):
+        return pd.read_csv(self.path, encoding=self.encoding, dtype=str, **kw)
+
+    def _fallback(self):
+        """sniff_encoding solo mira el primer MB: si más adelante no es UTF-8, se relee como latin-1."""
+        if self.encoding == "latin-1": return False
+        logging.info("%s no es UTF-8 más allá de la muestra; se lee como latin-1", self.path)
+        self.encoding = "latin-1"; return True
+
+    def sample(self, n):
+        try: return self._read_csv(nrows=n)
+        except UnicodeDecodeError:
+            if not self._fallback(): raise
+            return self._read_csv(nrows=n)
+
+    def read(self, usecols=None):
+        try: return self._read_csv(usecols=usecols)
+        except UnicodeDecodeError:
+            if not self._fallback(): raise
+            return self._read_csv(usecols=usecols)
+
+    def chunks(self, usecols, rows):
+        done = 0
+        try:
+            with self._read_csv(usecols=usecols, chunksize=rows) as reader:
+                for chunk in reader:
+                    yield chunk; done += len(chunk)
+        except UnicodeDecodeError:
+            if not self._fallback(): raise
+            # los bloques ya entregados no se repiten: se saltean done filas de la relectura
+            with self._read_csv(usecols=usecols, chunksize=rows) as reader:
+                for chunk in reader:
+                    if done >= len(chunk): done -= len(chunk); continue
+                    yield chunk.iloc[done:]; done = 0
+
+def _optional(module: str, package: str, what: str):
+    try: return __import__(module, fromlist=["_"])
+    except ImportError as e:
+        raise ImportError(f"Para leer {what} instala {package}: pip install {package}") from e
+
+class ParquetReader(TableReader):
+    """Parquet es columnar: solo se leen del disco las columnas pedidas (pyarrow)."""
+    def _file(self):
+        return _optional("pyarrow.parquet", "pyarrow", "Parquet").ParquetFile(self.path)
+
+    def sample(self, n):
+        batch = next(self._file().iter_batches(batch_size=n), None)
+        return pd.DataFrame() if batch is None else _text_frame(batch.to_pandas())
+
+    def read(self, usecols=None):
+        return _text_frame(self._file().read(columns=usecols).to_pandas())
+
+    def chunks(self, usecols, rows):
+        for batch in self._file().iter_batches(batch_size=rows, columns=usecols):
+            yield _text_frame(batch.to_pandas())
+
+class ExcelReader(TableReader):
+    """Primera hoja del libro (openpyxl); las celdas numéricas enteras llegan sin ".0"."""
+    def _read_excel(self, **kw):
+        _optional("openpyxl", "openpyxl", "Excel")
+        return pd.read_excel(self.path, sheet_name=0, dtype=str, engine="openpyxl", **kw)
+
+    def sample(self, n): return self._read_excel(nrows=n)
+
+    def read(self, usecols=None): return self._read_excel(usecols=usecols)
+
+class JsonLinesReader(TableReader):
+    """Un objeto JSON por línea; se proyecta bloque a bloque para no cargar las claves que sobran."""
+    def _reader(self, rows, **kw):
+        return pd.read_json(self.path, lines=True, dtype=False, chunksize=rows, encoding="utf-8", **kw)
+
+    def sample(self, n):
+        with self._reader(n, nrows=n) as reader:
+            return _text_frame(next(iter(reader), pd.DataFrame()))
+
+    def read(self, usecols=None):
+        parts = list(self.chunks(usecols, STREAM_CSV_ROWS))
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=usecols)
+
+    def chunks(self, usecols, rows):
+        with self._reader(rows) as reader:
+            for chunk in reader:
+                chunk = _text_frame(chunk)
+                yield chunk if usecols is None else chunk.reindex(columns=usecols)
+
+# extensión → lector; cualquier otra se lee como CSV
+READERS = {".csv": CsvReader, ".txt": CsvReader,
+           ".parquet": ParquetReader, ".pq": ParquetReader,
+           ".xlsx": ExcelReader, ".xlsm": ExcelReader,
+           ".jsonl": JsonLinesReader, ".ndjson": JsonLinesReader}
+
+def open_table(p) -> TableReader:
+    return READERS.get(Path(p).suffix.lower(), CsvReader)(p)
+
+def _plan_columns(reader: TableReader, overrides: dict, sample_rows=AUTODETECT_ROWS, candidates=False):
+    """
+    Autodetecta con una muestra de sample_rows filas; devuelve (mapping, columnas a leer):
+    las mapeadas y, con candidates=True, también las que CANDIDATES podría elegir.
+    """
+    sample = reader.sample(sample_rows)
+    mapping, _ = map_columns(sample, overrides)
+    wanted = set(mapping.values())
+    if candidates: wanted |= {norm_col(o) for opts in CANDIDATES.values() for o in opts}
+    return mapping, [c for c in sample.columns if norm_col(c) in wanted]
+
+def read_any(p, overrides=None):
+    """
+    Para la interfaz: las columnas que la autodetección, CANDIDATES u overrides eligen, como
+    texto y con sus nombres originales, para re-mapear sin volver a leer el archivo.
+    """
+    reader = open_table(p)
+    _, usecols = _plan_columns(reader, overrides or {}, candidates=True)
+    return reader.read(usecols)
+
+@instrumented("read_table")
+def read_table(p, overrides: dict, sample_rows=AUTODETECT_ROWS):
+    """
+    CSV / Parquet / Excel / JSON Lines cargando solo las columnas mapeadas (autodetección
+    sobre una muestra). Devuelve (mapping, df) como map_columns.
+    """
+    reader = open_table(p)
+    mapping, usecols = _plan_columns(reader, overrides, sample_rows)
+    mapping = {k: c for k, c in mapping.items() if c != "_cantidad_default"}   # map_columns la vuelve a crear
+    return map_columns(reader.read(usecols), mapping)
+
+def iter_table_chunks(p, overrides: dict, chunk_rows=STREAM_CSV_ROWS):
+    """
+    Lectura en streaming: autodetecta columnas con una muestra de AUTODETECT_ROWS filas
+    y luego lee el archivo por bloques cargando solo las columnas mapeadas.
+    Devuelve (mapping, iterador de DataFrames con columnas normalizadas).
+    """
+    reader = open_table(p)
+    mapping, usecols = _plan_columns(reader, overrides)
+    def chunks():
+        for chunk in reader.chunks(usecols, chunk_rows):
+            yield chunk.rename(columns={c:norm_col(c) for c in chunk.columns})
+    return mapping, chunks()
+
 def parse_int_safe(x, default=1):
     try:
-        import pandas as _pd
-        if _pd.isna(x) or (isinstance(x,str) and x.strip()==""): return default
+        if pd.isna(x) or (isinstance(x,str) and x.strip()==""): return default
         return max(0, int(float(str(x).strip())))
     except Exception:
         return default
 
+class LabelColumns:
+    """
+    Registros de etiquetas en columnas: una entrada por fila del CSV (nombre, sku y
+    barcode como arrays de str, cantidad como int64). Las copias no se materializan;
+    se expanden al iterar repitiendo índices de fila. len() = total de copias.
+    name_fs / sku_fs (opcionales, ver fit_label_text) fijan el tamaño por fila.
+    """
+    __slots__ = ("nombre", "sku", "barcode", "cantidad", "name_fs", "sku_fs")
+
+    def __init__(self, nombre, sku, barcode, cantidad, name_fs=None, sku_fs=None):
+        self.nombre, self.sku, self.barcode = nombre, sku, barcode
+        self.cantidad = np.asarray(cantidad, dtype=np.int64)
+        self.name_fs, self.sku_fs = name_fs, sku_fs
+
+    def __len__(self): return int(self.cantidad.sum())
+
+    @property
+    def rows(self): return len(self.cantidad)
+
+    def record(self, i) -> dict:
+        rec = {"nombre": self.nombre[i], "sku": self.sku[i], "barcode": self.barcode[i]}
+        if self.name_fs is not None: rec["name_fs"] = float(self.name_fs[i])
+        if self.sku_fs is not None: rec["sku_fs"] = float(self.sku_fs[i])
+        return rec
+
+    def copy_index(self) -> np.ndarray:
+        """Índice de fila de cada copia, en orden (fila 0 × cantidad[0], fila 1 …)."""
+        return np.repeat(np.arange(self.rows), self.cantidad)
+
+    def __iter__(self):
+        """Un registro por copia; las copias de una fila comparten el mismo dict."""
+        for i in np.flatnonzero(self.cantidad):
+            rec = self.record(i)
+            for _ in range(self.cantidad[i]): yield rec
+
+def _text_column(df, col) -> np.ndarray:
+    if col not in df.columns: return np.full(len(df), "", dtype=object)
+    # str(x) del registro original: NaN se imprime como "nan"
+    return df[col].astype(str).fillna("nan").str.strip().to_numpy(dtype=object)
+
+def _cantidad_column(df, col, default=1) -> np.ndarray:
+    """parse_int_safe vectorizado: vacío / no numérico → default, negativos → 0."""
+    if col not in df.columns: return np.full(len(df), default, dtype=np.int64)
+    s = df[col]
+    if not pd.api.types.is_numeric_dtype(s): s = s.astype(str).str.strip()
+    num = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+    ok = np.isfinite(num)
+    return np.where(ok, np.clip(np.trunc(np.where(ok, num, 0)), 0, np.iinfo(np.int64).max),
+                    default).astype(np.int64)
+
+@instrumented("build_labels")
+def label_columns(df, mapping) -> LabelColumns:
+    """
+    build_labels por columnas (sin iterrows): strip de texto, solo dígitos en el código
+    y cantidad numérica con la misma semántica de parse_int_safe (vacío → 1, negativo → 0).
+    """
+    barcode = _text_column(df, mapping["barcode"])
+    barcode = pd.Series(barcode, dtype=object).str.replace(r"\D", "", regex=True).to_numpy(dtype=object)
+    return LabelColumns(_text_column(df, mapping["nombre"]), _text_column(df, mapping["sku"]),
+                        barcode, _cantidad_column(df, mapping["cantidad"]))
+
+def iter_labels(frames, mapping, prepare=None):
+    """
+    Versión perezosa de build_labels: `frames` es un DataFrame o un iterable de
+    DataFrames (p. ej. iter_table_chunks); produce un registro por copia.
+    prepare(labels, df, primera_fila) se aplica a cada bloque (p. ej. fit_label_text,
+    preflight_barcodes).
+    """
+    if isinstance(frames, pd.DataFrame): frames = (frames,)
+    first = 0
+    for df in frames:
+        labels = label_columns(df, mapping)
+        if prepare: prepare(labels, df, first)
+        first += labels.rows
+        yield from labels
+
 def build_labels(df, mapping):
-    out=[]
-    for _,r in df.iterrows():
-        nombre  = str(r.get(mapping["nombre"], "")).strip()
-        sku     = str(r.get(mapping["sku"], "")).strip()
-        barcode = re.sub(r"\D","", str(r.get(mapping["barcode"], "")).strip())
-        cant    = parse_int_safe(r.get(mapping["cantidad"]),1)
-        for _ in range(cant): out.append({"nombre":nombre,"sku":sku,"barcode":barcode})
-    return out
+    return [dict(r) for r in label_columns(df, mapping)]
+
+# ================== Validación de códigos (pre-vuelo) ==================
+BARCODE_CHECK_MODES = ("off", "report", "repair", "reject")
+BARCODE_CHECK_DEFAULT = "report"
+# largo → simbología GS1 que barcode_type dibuja como tal (se valida y se puede corregir)
+CHECKSUM_SYMBOLOGIES = {13: "ean13"}
+# largo → GTIN que barcode_type dibuja como Code128 (UPC-A, EAN-8): se valida el dígito
+# pero solo se informa; como Code128 el código es válido y no se corrige ni se omite
+GTIN_AS_CODE128 = {12: "upca", 8: "ean8"}
+SYMBOLOGIES = ("", "code128", "ean13")
+PREFLIGHT_PROBLEMS = ("", "vacio", "digito_verificador", "caracteres_no_numericos",
+                      "gtin_digito_verificador", "gtin_como_code128")
+PREFLIGHT_NOTICES = ("gtin_digito_verificador", "gtin_como_code128")    # avisos: "reject" no las omite
+PREFLIGHT_COLUMNS = ["fila", "codigo_original", "codigo", "simbologia", "problema", "codigo_corregido"]
+
+def gs1_check_digits(digits: np.ndarray) -> np.ndarray:
+    """
+    Dígito verificador GS1 de cada fila de `digits` (matriz uint8 de n × largo, el
+    último dígito se ignora): pesos 3,1,3… desde la derecha.
+    """
+    payload = digits[:, :-1].astype(np.int32)
+    weights = np.where(np.arange(payload.shape[1])[::-1] % 2 == 0, 3, 1)
+    return (10 - (payload @ weights) % 10) % 10
+
+def _digit_matrix(codes: np.ndarray, idx: np.ndarray, length: int) -> np.ndarray:
+    """Códigos ASCII de `length` dígitos (filas idx) como matriz uint8 de len(idx) × length."""
+    return (np.frombuffer("".join(codes[idx]).encode("ascii"), dtype=np.uint8) - 48).reshape(-1, length)
+
+def preflight_barcodes(labels: LabelColumns, raw=None, mode=BARCODE_CHECK_DEFAULT, first_row=0) -> pd.DataFrame:
+    """
+    Revisión de la columna de códigos antes de generar (vectorizada por largo de código):
+    clasifica la simbología como la dibuja barcode_type (13 dígitos EAN-13, el resto
+    Code128), valida el dígito verificador y detecta códigos vacíos o con caracteres no
+    numéricos en `raw` (el texto original, que label_columns reduce a dígitos). Los
+    dígitos no ASCII (p. ej. de ancho completo) cuentan como caracteres no numéricos.
+    Los GTIN de 12 u 8 dígitos (UPC-A, EAN-8) salen como Code128: se informan como
+    gtin_digito_verificador si el dígito no cuadra y si no como gtin_como_code128
+    (PREFLIGHT_NOTICES, solo avisos: ni "repair" ni "reject" los tocan).
+    python-barcode recalcula en silencio el dígito de un EAN-13 inválido, así que las
+    barras no coincidirían con el texto impreso; make_barcode_image pinta un bloque negro
+    si el código está vacío.
+    mode: "report" solo informa; "repair" corrige el dígito verificador en labels.barcode;
+    "reject" deja en 0 copias las filas con problema. Devuelve las filas con problema
+    (fila 1 = primera fila de datos, + first_row), columnas PREFLIGHT_COLUMNS.
+    """
+    if mode == "off": return pd.DataFrame(columns=PREFLIGHT_COLUMNS)
+    if mode not in BARCODE_CHECK_MODES: raise ValueError(f"Modo de validación desconocido: {mode!r}")
+    codes = labels.barcode
+    n = len(codes)
+    # simbología y problema como índices en SYMBOLOGIES / PREFLIGHT_PROBLEMS (sin arrays de objetos)
+    lens = np.fromiter(map(len, codes), dtype=np.int64, count=n)
+    ascii_ok = np.fromiter((c.isascii() for c in codes), dtype=bool, count=n)
+    symb = np.ones(n, dtype=np.int8)                  # code128
+    problem = np.zeros(n, dtype=np.int8)
+    symb[lens == 0] = 0; problem[lens == 0] = 1
+    problem[~ascii_ok] = 3                            # "７５０…": \D los deja pasar, no se pueden dibujar
+    fixed = {}
+    for length, name in CHECKSUM_SYMBOLOGIES.items():
+        idx = np.flatnonzero((lens == length) & ascii_ok)
+        if not len(idx): continue
+        symb[idx] = SYMBOLOGIES.index(name)
+        digits = _digit_matrix(codes, idx, length)
+        expected = gs1_check_digits(digits)
+        bad = np.flatnonzero(expected != digits[:, -1])
+        problem[idx[bad]] = 2
+        fixed.update((r, codes[r][:-1] + str(d)) for r, d in zip(idx[bad], expected[bad]))
+    if raw is not None:
+        raw = np.asarray(raw, dtype=object)
+        raw_lens = np.fromiter(map(len, raw), dtype=np.int64, count=n)
+        problem[(raw_lens != lens) & (problem == 0)] = 3
+    for length in GTIN_AS_CODE128:
+        idx = np.flatnonzero((lens == length) & (problem == 0))
+        if not len(idx): continue
+        digits = _digit_matrix(codes, idx, length)
+        problem[idx] = np.where(gs1_check_digits(digits) == digits[:, -1], 5, 4)
+    bad_rows = np.flatnonzero(problem)
+    original = (raw if raw is not None else codes)[bad_rows]
+    corrected = [fixed.get(r, "") for r in bad_rows]
+    if mode == "repair" and fixed:
+        rows = np.fromiter(fixed, dtype=np.int64, count=len(fixed))
+        labels.barcode = codes = codes.copy()     # el array de pandas puede ser de solo lectura
+        codes[rows] = np.array(list(fixed.values()), dtype=object)
+    elif mode == "reject":
+        labels.cantidad = labels.cantidad.copy()
+        notices = np.isin(problem[bad_rows], [PREFLIGHT_PROBLEMS.index(p) for p in PREFLIGHT_NOTICES])
+        labels.cantidad[bad_rows[~notices]] = 0
+    return pd.DataFrame({"fila": bad_rows + first_row + 1, "codigo_original": original,
+                         "codigo": codes[bad_rows],
+                         "simbologia": np.asarray(SYMBOLOGIES, dtype=object)[symb[bad_rows]],
+                         "problema": np.asarray(PREFLIGHT_PROBLEMS, dtype=object)[problem[bad_rows]],
+                         "codigo_corregido": corrected}, columns=PREFLIGHT_COLUMNS)
+
+def preflight_report_path(out_path) -> Path:
+    p = Path(out_path)
+    return p.with_name(f"{p.stem}_codigos_rechazados.csv")
+
+def save_preflight_report(report: pd.DataFrame, out_path, mode=BARCODE_CHECK_DEFAULT) -> int:
+    """Escribe <salida>_codigos_rechazados.csv si hubo problemas; devuelve cuántas filas."""
+    path = preflight_report_path(out_path)
+    if report.empty:
+        if path.exists(): path.unlink()
+        if mode != "off": logging.info("Códigos: sin problemas")
+        return 0
+    report.to_csv(path, index=False, encoding="utf-8-sig")
+    counts = report["problema"].value_counts().to_dict()
+    logging.warning("Códigos (%s): %d filas con problemas %s; ver %s", mode, len(report), counts, path)
+    return len(report)
+
+# ================== Caché LRU ==================
+class LRUCache:
+    """
+    LRU acotado por número de entradas y por bytes (sizeof estima el peso de cada valor).
+    Seguro entre hilos; lleva contadores de hits / misses / evictions.
+    """
+    _MISSING = object()
+
+    def __init__(self, max_items=1024, max_bytes=64 << 20, sizeof=len):
+        self.max_items, self.max_bytes, self.sizeof = int(max_items), int(max_bytes), sizeof
+        self._data = OrderedDict(); self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self): return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            v = self._data.get(key, self._MISSING)
+            if v is self._MISSING:
+                self.misses += 1; return default
+            self._data.move_to_end(key); self.hits += 1
+            return v[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if value is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None: self._bytes -= old[1]
+            if size > self.max_bytes: return
+            self._data[key] = (value, size); self._bytes += size
+            while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+                _, (_, sz) = self._data.popitem(last=False)
+                self._bytes -= sz; self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        v = self.get(key, self._MISSING)
+        if v is self._MISSING:
+            v = factory(); self.put(key, v)
+        return v
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._data), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+def _image_nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+# Nivel 1: patrón de módulos por código. Nivel 2: imagen / PNG por (código, px, dpi).
+BARCODE_PATTERN_CACHE = LRUCache(max_items=200_000, max_bytes=32 << 20)
+BARCODE_IMAGE_CACHE   = LRUCache(max_items=256, max_bytes=64 << 20, sizeof=_image_nbytes)
+BARCODE_PNG_CACHE     = LRUCache(max_items=4096, max_bytes=64 << 20)
+
+def barcode_cache_stats() -> dict:
+    return {"pattern": BARCODE_PATTERN_CACHE.stats(),
+            "image": BARCODE_IMAGE_CACHE.stats(),
+            "png": BARCODE_PNG_CACHE.stats()}
 
 # ================== Fuentes (PIL + ReportLab) ==================
 def _find_font_path():
@@ -120,52 +811,205 @@ def _find_font_path():
         if Path(p).exists(): return p
     return None
 
-def get_font_px_from_pt(pt):
-    size_px = max(1, int(round(pt * PT_TO_MM * PREVIEW_SCALE)))
-    path=_find_font_path()
-    if path:
-        try: return ImageFont.truetype(path, size_px)
-        except Exception: pass
-    try: return ImageFont.truetype("DejaVuSans.ttf", size_px)
-    except Exception: return ImageFont.load_default()
+class FontRegistry:
+    """
+    Fuente de la UI compartida por vista previa y PDF (una instancia por proceso: FONTS).
+    La ruta se resuelve una sola vez, las ImageFont de PIL se guardan por tamaño en un LRU,
+    la TTFont de ReportLab se registra una sola vez y los avances de cada glifo quedan en
+    tabla, así medir texto es una suma de búsquedas.
+    """
+    _UNSET = object()
+
+    def __init__(self, max_sizes=32):
+        self._lock = threading.RLock()
+        self._path = self._UNSET
+        self._rl_name = None
+        self._pil = LRUCache(max_items=max_sizes, sizeof=lambda f: 0)
+        self._advances = weakref.WeakKeyDictionary()    # ImageFont -> {carácter: avance px}
+
+    @property
+    def path(self):
+        if self._path is self._UNSET:
+            with self._lock:
+                if self._path is self._UNSET: self._path = _find_font_path()
+        return self._path
+
+    def pil_font(self, size_px: int):
+        return self._pil.get_or_create(int(size_px), lambda: self._load_pil(int(size_px)))
+
+    def _load_pil(self, size_px):
+        if self.path:
+            try: return ImageFont.truetype(self.path, size_px)
+            except Exception: pass
+        try: return ImageFont.truetype("DejaVuSans.ttf", size_px)
+        except Exception: return ImageFont.load_default()
+
+    def reportlab_font(self) -> str:
+        with self._lock:
+            if self._rl_name is None:
+                try:
+                    if self.path: pdfmetrics.registerFont(TTFont("UIFont", self.path)); self._rl_name = "UIFont"
+                    else:
+                        pdfmetrics.registerFont(TTFont("DejaVu","/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"))
+                        self._rl_name = "DejaVu"
+                except Exception:
+                    self._rl_name = "Helvetica"
+            return self._rl_name
+
+    def text_width_px(self, text: str, font) -> int:
+        """Ancho de avance del texto (como stringWidth en el PDF), con tabla por glifo."""
+        try: table = self._advances[font]
+        except KeyError: table = self._advances.setdefault(font, {})
+        w = 0.0
+        for ch in text:
+            adv = table.get(ch)
+            if adv is None: adv = table[ch] = font.getlength(ch)
+            w += adv
+        return int(round(w))
+
+    def stats(self) -> dict:
+        return {"path": self.path, "reportlab": self._rl_name, "pil": self._pil.stats()}
+
+FONTS = FontRegistry()
+
+def get_font_px_from_pt(pt, scale=PREVIEW_SCALE):
+    return FONTS.pil_font(max(1, int(round(pt * PT_TO_MM * scale))))
 
 def register_reportlab_font():
-    try:
-        path=_find_font_path()
-        if path: pdfmetrics.registerFont(TTFont("UIFont", path)); return "UIFont"
-        pdfmetrics.registerFont(TTFont("DejaVu","/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")); return "DejaVu"
-    except Exception:
-        return "Helvetica"
+    return FONTS.reportlab_font()
 
 # ================== Barcode ==================
-def make_barcode_image(code: str, width_px: int, height_px: int) -> Image.Image:
+def barcode_type(code: str) -> str:
+    return 'ean13' if re.fullmatch(r"\d{13}", code or "") else 'code128'
+
+@functools.lru_cache(maxsize=None)
+def _barcode_class(bc_type: str):
+    import barcode
+    return barcode.get_barcode_class(bc_type)
+
+def _encode_modules(code: str):
     try:
-        import barcode
-        from barcode.writer import ImageWriter
-        bc_type = 'ean13' if re.fullmatch(r"\d{13}", code or "") else 'code128'
-        cls = barcode.get_barcode_class(bc_type)
-        bc = cls(code, writer=ImageWriter())
-        base = bc.render(writer_options={
-            "module_width": 0.18, "module_height": max(1,height_px//3),
-            "quiet_zone": 2.0, "font_size": 0, "text": ""
-        })
+        return "".join(_barcode_class(barcode_type(code))(code).build())
     except Exception:
-        base = Image.new("RGB",(max(1,width_px),max(1,height_px)),"black")
-    return base.resize((max(1,width_px),max(1,height_px)), Image.NEAREST)
+        return None
+
+def barcode_modules(code: str):
+    """
+    Patrón de módulos del código ('1' = barra, '0' = espacio), sin zona silenciosa.
+    None si el código no se puede codificar. Cacheado por código.
+    """
+    code = code or ""
+    return BARCODE_PATTERN_CACHE.get_or_create(code, lambda: _encode_modules(code))
 
+def draw_barcode_vector(c, code: str, x, y, w, h):
+    """
+    Dibuja las barras como rectángulos PDF en la caja (x, y, w, h), con la misma
+    proporción de zona silenciosa que el render raster. Si el código no se puede
+    codificar se dibuja un bloque negro (igual que make_barcode_image).
+    """
+    pattern = barcode_modules(code)
+    p = c.beginPath()
+    if not pattern:
+        p.rect(x, y, w, h)
+    else:
+        mod_w = w / (len(pattern) + 2*BARCODE_QUIET_MODULES)
+        x0 = x + BARCODE_QUIET_MODULES*mod_w
+        for m in re.finditer("1+", pattern):
+            p.rect(x0 + m.start()*mod_w, y, (m.end()-m.start())*mod_w, h)
+    c.drawPath(p, stroke=0, fill=1)
+
+def _module_columns(n_modules: int, width_px: int) -> np.ndarray:
+    """
+    Índice de módulo para cada columna de píxel (-1 = zona silenciosa).
+    Cada módulo ocupa un número entero de píxeles (el más cercano al ancho
+    proporcional que aún quepa en la caja), con las barras centradas; si no cabe
+    ni 1 px por módulo se reparte proporcionalmente.
+    """
+    total = n_modules + 2*BARCODE_QUIET_MODULES
+    mpx = min(int(round(width_px / total)), width_px // n_modules)
+    if mpx >= 1:
+        bar_px = mpx * n_modules
+        x0 = (width_px - bar_px) // 2
+        cols = np.full(width_px, -1, dtype=np.intp)
+        cols[x0:x0+bar_px] = np.arange(bar_px) // mpx
+        return cols
+    pos = (np.arange(width_px) + 0.5) * total / width_px - BARCODE_QUIET_MODULES
+    cols = np.floor(pos).astype(np.intp)
+    cols[(cols < 0) | (cols >= n_modules)] = -1
+    return cols
+
+def _bar_masks(patterns, width_px: int) -> np.ndarray:
+    """
+    Máscara (len(patterns), width_px) con True donde hay barra; una sola operación
+    vectorizada por cada longitud de patrón. Patrones None quedan en bloque negro.
+    """
+    masks = np.ones((len(patterns), width_px), dtype=bool)
+    by_len = {}
+    for i, p in enumerate(patterns):
+        if p: by_len.setdefault(len(p), []).append(i)
+    for n, idx in by_len.items():
+        bits = np.frombuffer("".join(patterns[i] for i in idx).encode("ascii"),
+                             dtype=np.uint8).reshape(len(idx), n) == ord("1")
+        cols = _module_columns(n, width_px)
+        rows = np.zeros((len(idx), width_px), dtype=bool)
+        inside = cols >= 0
+        rows[:, inside] = bits[:, cols[inside]]
+        masks[idx] = rows
+    return masks
+
+def _mask_to_image(mask_row: np.ndarray, height_px: int, mode: str) -> Image.Image:
+    if mode == "1":
+        return Image.fromarray(np.repeat(~mask_row[None, :], height_px, axis=0))
+    px = np.where(mask_row, 0, 255).astype(np.uint8)
+    img = Image.fromarray(np.repeat(px[None, :], height_px, axis=0), mode="L")
+    return img if mode == "L" else img.convert(mode)
+
+def rasterize_barcodes(codes, width_px: int, height_px: int, mode="L") -> list:
+    """
+    Rasteriza muchos códigos de una vez directamente a width_px × height_px
+    (sin render + resize). mode: "L" (gris), "1" (1 bit) o "RGB".
+    Los resultados quedan en BARCODE_IMAGE_CACHE.
+    """
+    width_px, height_px = max(1,int(width_px)), max(1,int(height_px))
+    codes = [c or "" for c in codes]
+    keys = [(c, width_px, height_px, mode) for c in codes]
+    out = [BARCODE_IMAGE_CACHE.get(k) for k in keys]
+    todo = sorted({k[0] for k, img in zip(keys, out) if img is None})
+    if todo:
+        masks = _bar_masks([barcode_modules(c) for c in todo], width_px)
+        fresh = {}
+        for c, m in zip(todo, masks):
+            fresh[c] = _mask_to_image(m, height_px, mode)
+            BARCODE_IMAGE_CACHE.put((c, width_px, height_px, mode), fresh[c])
+        out = [img if img is not None else fresh[k[0]] for k, img in zip(keys, out)]
+    return out
+
+@instrumented("make_barcode_image")
+def make_barcode_image(code: str, width_px: int, height_px: int, mode="L") -> Image.Image:
+    """
+    Imagen del código a width_px × height_px (ver rasterize_barcodes). Cacheada:
+    la imagen devuelta es compartida, no modificarla (pegarla o guardarla está bien).
+    """
+    return rasterize_barcodes([code], width_px, height_px, mode)[0]
+
+@instrumented("barcode_png_bytes")
 def barcode_png_bytes(code: str, width_mm: float, height_mm: float, dpi=300) -> bytes:
     px_w = int(width_mm * dpi / 25.4)
     px_h = int(height_mm * dpi / 25.4)
+    key = (code or "", px_w, px_h, dpi)
+    hit = BARCODE_PNG_CACHE.get(key)
+    if hit is not None: return hit
     img = make_barcode_image(code, px_w, px_h)
-    buf = io.BytesIO(); img.save(buf, format="PNG"); return buf.getvalue()
+    buf = io.BytesIO(); img.save(buf, format="PNG")
+    BARCODE_PNG_CACHE.put(key, buf.getvalue()); return buf.getvalue()
 
 # ================== Medidas texto / dibujo ==================
 def pil_text_width_px(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont) -> int:
     try:
+        return FONTS.text_width_px(text, font)
+    except Exception:
         b = draw.textbbox((0,0), text, font=font)
         return b[2]-b[0]
-    except Exception:
-        return font.getsize(text)[0]
 
 def draw_centered_baseline(draw, x_c, baseline_y, text, font, fill="black"):
     try:
@@ -182,25 +1026,30 @@ def build_preview_image(rec, *,
                         bar_h_mm, bar_w_mm,
                         m_left_mm, m_right_mm, m_top_mm, m_bottom_mm,
                         line_spacing_mm, title_sku_space_mm, sku_spacing_mm,
-                        title_max_w_mm, sku_max_w_mm):
+                        title_max_w_mm, sku_max_w_mm, scale=PREVIEW_SCALE, frame=True):
     """
     Versión single-line: título y SKU en 1 línea, sin truncar ni '...'.
     title_max_w_mm y sku_max_w_mm no se usan aquí (se conservan por compatibilidad).
+    scale = px por mm (PREVIEW_SCALE a escala real; menos para miniaturas, dpi/25.4 para imprimir).
+    frame=False: escala de grises sobre blanco, sin el marco de la vista previa (ver render_label_bitmap).
     """
-    scale = PREVIEW_SCALE
     W_px = int(LABEL_W_MM * scale)
     H_px = int(LABEL_H_MM * scale)
-    img = Image.new("RGB",(W_px,H_px),"#0b1220")
-    draw = ImageDraw.Draw(img)
-    draw.rectangle([0,0,W_px-1,H_px-1], fill="white", outline="#334155")
+    if frame:
+        img = Image.new("RGB",(W_px,H_px),"#0b1220")
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([0,0,W_px-1,H_px-1], fill="white", outline="#334155")
+    else:
+        img = Image.new("L",(W_px,H_px),"white")
+        draw = ImageDraw.Draw(img)
 
     m_left, m_right = int(m_left_mm*scale), int(m_right_mm*scale)
     m_top, m_bottom = int(m_top_mm*scale), int(m_bottom_mm*scale)
     usable_w_px = W_px - (m_left + m_right)
 
-    name_font = get_font_px_from_pt(name_fs)
-    sku_font  = get_font_px_from_pt(sku_fs)
-    code_font = get_font_px_from_pt(code_fs)
+    name_font = get_font_px_from_pt(rec.get("name_fs", name_fs), scale)    # por etiqueta si hay autoajuste
+    sku_font  = get_font_px_from_pt(rec.get("sku_fs", sku_fs), scale)
+    code_font = get_font_px_from_pt(code_fs, scale)
 
     # ---- TÍTULO: una sola línea (sin '...')
     y_baseline = m_top
@@ -230,10 +1079,11 @@ def build_preview_image(rec, *,
     baseline_bottom = H_px - int((m_bottom_mm + 1.5) * scale)
     draw_centered_baseline(draw, W_px//2, baseline_bottom, code, code_font)
 
-    draw.rectangle([0,0,W_px-1,H_px-1], outline="#0ea5e9")
+    if frame: draw.rectangle([0,0,W_px-1,H_px-1], outline="#0ea5e9")
     return img
 
 # ================== PDF ==================
+@instrumented("draw_label_pdf")
 def draw_label_pdf(c, W, H, rec, *,
                    base_font="Helvetica",
                    name_fs=NAME_FONT_SIZE_DEFAULT, sku_fs=SKU_FONT_SIZE_DEFAULT, code_fs=CODE_TEXT_SIZE_DEFAULT,
@@ -241,9 +1091,11 @@ def draw_label_pdf(c, W, H, rec, *,
                    m_left_mm=MARGIN_LEFT_MM_DEFAULT, m_right_mm=MARGIN_RIGHT_MM_DEFAULT,
                    m_top_mm=MARGIN_TOP_MM_DEFAULT, m_bottom_mm=MARGIN_BOTTOM_MM_DEFAULT,
                    line_spacing_mm=LINE_SPACING_MM_DEFAULT, title_sku_space_mm=TITLE_SKU_SPACE_MM_DEFAULT, sku_spacing_mm=SKU_SPACING_MM_DEFAULT,
-                   title_max_w_mm=TITLE_MAX_W_MM_DEFAULT, sku_max_w_mm=SKU_MAX_W_MM_DEFAULT):
+                   title_max_w_mm=TITLE_MAX_W_MM_DEFAULT, sku_max_w_mm=SKU_MAX_W_MM_DEFAULT,
+                   bar_mode=BARCODE_MODE_DEFAULT):
     """
     Versión single-line también para PDF: sin truncar ni saltos.
+    bar_mode: "vector" dibuja las barras como rectángulos; "raster" incrusta un PNG a 300 dpi.
     """
     RLMM = mm
     margin_left, margin_right = float(m_left_mm)*RLMM, float(m_right_mm)*RLMM
@@ -252,7 +1104,7 @@ def draw_label_pdf(c, W, H, rec, *,
 
     # ---- TÍTULO (una línea)
     y = H - margin_top
-    c.setFont(base_font, float(name_fs))
+    c.setFont(base_font, float(rec.get("name_fs", name_fs)))     # por etiqueta si hay autoajuste
     c.drawCentredString(W/2, y, rec["nombre"] or "")
     y -= float(line_spacing_mm)*RLMM
 
@@ -260,7 +1112,7 @@ def draw_label_pdf(c, W, H, rec, *,
     y -= float(title_sku_space_mm)*RLMM
 
     # ---- SKU (una línea)
-    c.setFont(base_font, float(sku_fs))
+    c.setFont(base_font, float(rec.get("sku_fs", sku_fs)))
     c.drawCentredString(W/2, y, (rec["sku"] or ""))
     y -= float(sku_spacing_mm)*RLMM
 
@@ -269,293 +1121,924 @@ def draw_label_pdf(c, W, H, rec, *,
     desired_w_mm = float(bar_w_mm)
     if desired_w_mm*RLMM > usable_w:
         desired_w_mm = usable_w/RLMM
-    png_bytes = barcode_png_bytes(code, desired_w_mm, float(bar_h_mm), dpi=300)
-    img = ImageReader(io.BytesIO(png_bytes))
     x = margin_left + (usable_w - desired_w_mm*RLMM)/2.0
     top = y - 2*RLMM - float(bar_h_mm)*RLMM
-    c.drawImage(img, x, top, width=desired_w_mm*RLMM, height=float(bar_h_mm)*RLMM,
-                preserveAspectRatio=False, mask='auto')
+    if bar_mode == "vector":
+        draw_barcode_vector(c, code, x, top, desired_w_mm*RLMM, float(bar_h_mm)*RLMM)
+    else:
+        png_bytes = barcode_png_bytes(code, desired_w_mm, float(bar_h_mm), dpi=300)
+        img = ImageReader(io.BytesIO(png_bytes))
+        c.drawImage(img, x, top, width=desired_w_mm*RLMM, height=float(bar_h_mm)*RLMM,
+                    preserveAspectRatio=False, mask='auto')
 
     # Texto del código
     c.setFont(base_font, float(code_fs))
     c.drawCentredString(W/2, margin_bottom + 1.5*RLMM, code)
 
-# ================== UI: control +/− grande ==================
-class PlusMinus(tk.Frame):
-    """
-    Control numérico con Entry centrado y botones +/- grandes (ttk).
-    """
-    def __init__(self, parent, label, var: tk.DoubleVar, minv, maxv, step, on_change=None):
-        super().__init__(parent, bg="#0e1a34")
-        self.var, self.minv, self.maxv, self.step = var, float(minv), float(maxv), float(step)
-        self.on_change = on_change
-
-        ttk.Label(self, text=label).grid(row=0, column=0, columnspan=3, sticky="w")
-
-        self.btn_minus = ttk.Button(self, text="−", style="Big.TButton", command=self.dec, width=2)
-        self.btn_plus  = ttk.Button(self, text="+", style="Big.TButton", command=self.inc, width=2)
-        self.entry = tk.Entry(self, textvariable=self.var, justify="right",
-                              font=("Segoe UI", 11), width=8, relief="solid",
-                              bg="#0f172a", fg="#e5e7eb", insertbackground="#e5e7eb")
-
-        self.btn_minus.grid(row=1, column=0, padx=(0,8), pady=2)
-        self.entry.grid(row=1, column=1, padx=8, pady=2)
-        self.btn_plus.grid(row=1, column=2, padx=(8,0), pady=2)
-
-        self.entry.bind("<Return>", lambda e: self._clamp_and_fire())
-        self.entry.bind("<FocusOut>", lambda e: self._clamp_and_fire())
-
-    def _clamp_and_fire(self):
-        try: v=float(self.var.get())
-        except Exception: v=self.minv
-        v=max(self.minv, min(self.maxv, v))
-        self.var.set(round(v, 3))
-        if self.on_change: self.on_change()
-
-    def inc(self):
-        try: v=float(self.var.get())
-        except Exception: v=self.minv
-        v=min(self.maxv, v+self.step)
-        self.var.set(round(v,3))
-        if self.on_change: self.on_change()
-
-    def dec(self):
-        try: v=float(self.var.get())
-        except Exception: v=self.minv
-        v=max(self.minv, v-self.step)
-        self.var.set(round(v,3))
-        if self.on_change: self.on_change()
-
-# ================== APP ==================
-class App(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("Etiquetas 51x25 mm – PRO+ (Single-line)")
-        self.geometry("1120x760")
-        self.configure(bg="#0b1220")
-
-        style = ttk.Style(self)
-        try: style.theme_use("clam")
-        except Exception: pass
-        style.configure("Dark.TFrame", background="#0b1220")
-        style.configure("Card.TFrame", background="#0e1a34")
-        style.configure("TLabel", background="#0e1a34", foreground="#e5e7eb", font=("Segoe UI", 10))
-        style.configure("Header.TLabel", background="#0b1220", foreground="#93c5fd", font=("Segoe UI Semibold", 13))
-        style.configure("TButton", background="#1d4ed8", foreground="white", padding=8)
-        style.map("TButton", background=[("active","#2563eb")])
-        style.configure("Big.TButton", font=("Segoe UI", 12), padding=6)
-
-        # Vars
-        self.csv_path = tk.StringVar()
-        self.out_folder = tk.StringVar(value=str(Path.cwd()))
-        self.out_filename = tk.StringVar(value="etiquetas_51x25mm.pdf")
-        self.col_nombre = tk.StringVar(); self.col_sku = tk.StringVar()
-        self.col_barcode = tk.StringVar(); self.col_cantidad = tk.StringVar()
-
-        self.name_fs = tk.DoubleVar(value=NAME_FONT_SIZE_DEFAULT)
-        self.sku_fs  = tk.DoubleVar(value=SKU_FONT_SIZE_DEFAULT)
-        self.code_fs = tk.DoubleVar(value=CODE_TEXT_SIZE_DEFAULT)
-        self.bar_h   = tk.DoubleVar(value=BARCODE_HEIGHT_MM_DEFAULT)
-        self.bar_w   = tk.DoubleVar(value=BARCODE_WIDTH_MM_DEFAULT)
-
-        self.m_left  = tk.DoubleVar(value=MARGIN_LEFT_MM_DEFAULT)
-        self.m_right = tk.DoubleVar(value=MARGIN_RIGHT_MM_DEFAULT)
-        self.m_top   = tk.DoubleVar(value=MARGIN_TOP_MM_DEFAULT)
-        self.m_bottom= tk.DoubleVar(value=MARGIN_BOTTOM_MM_DEFAULT)
-
-        self.line_spacing = tk.DoubleVar(value=LINE_SPACING_MM_DEFAULT)
-        self.title_sku_space = tk.DoubleVar(value=TITLE_SKU_SPACE_MM_DEFAULT)
-        self.sku_spacing  = tk.DoubleVar(value=SKU_SPACING_MM_DEFAULT)
-
-        self.title_max_w = tk.DoubleVar(value=TITLE_MAX_W_MM_DEFAULT)  # sin uso actual
-        self.sku_max_w   = tk.DoubleVar(value=SKU_MAX_W_MM_DEFAULT)    # sin uso actual
-
-        self.df_cached=None; self.preview_photo=None
-
-        self.build_ui()
-
-        for v in (self.name_fs,self.sku_fs,self.code_fs,self.bar_h,self.bar_w,
-                  self.m_left,self.m_right,self.m_top,self.m_bottom,
-                  self.line_spacing,self.title_sku_space,self.sku_spacing,
-                  self.title_max_w,self.sku_max_w):
-            v.trace_add("write", lambda *a: self._safe_preview())
-
-    def build_ui(self):
-        root = ttk.Frame(self, style="Dark.TFrame"); root.pack(fill="both", expand=True, padx=16, pady=16)
-        ttk.Label(root, text="Generador de Etiquetas 51×25 mm", style="Header.TLabel").pack(anchor="w", pady=(0,8))
-
-        top = ttk.Frame(root, style="Card.TFrame"); top.pack(fill="x", pady=8, ipady=6, ipadx=6)
-
-        f1 = ttk.Frame(top, style="Card.TFrame"); f1.pack(fill="x", pady=6, padx=8)
-        ttk.Label(f1, text="CSV:").pack(side="left", padx=(0,8))
-        ttk.Entry(f1, textvariable=self.csv_path, width=62).pack(side="left", padx=(0,8))
-        ttk.Button(f1, text="Elegir CSV", command=self.choose_csv).pack(side="left")
-        ttk.Label(f1, text="Carpeta destino:").pack(side="left", padx=(16,8))
-        ttk.Entry(f1, textvariable=self.out_folder, width=42).pack(side="left", padx=(0,8))
-        ttk.Button(f1, text="Seleccionar", command=self.choose_folder).pack(side="left")
-
-        f2 = ttk.Frame(top, style="Card.TFrame"); f2.pack(fill="x", pady=6, padx=8)
-        ttk.Label(f2, text="Nombre PDF:").pack(side="left", padx=(0,8))
-        ttk.Entry(f2, textvariable=self.out_filename, width=32).pack(side="left", padx=(0,8))
-        ttk.Button(f2, text="Autodetectar columnas", command=self.autodetect).pack(side="left", padx=(16,0))
-
-        f3 = ttk.Frame(top, style="Card.TFrame"); f3.pack(fill="x", pady=6, padx=8)
-        for label, var in [("Columna Nombre", self.col_nombre),
-                           ("SKU", self.col_sku),
-                           ("Código", self.col_barcode),
-                           ("Cantidad", self.col_cantidad)]:
-            cell = ttk.Frame(f3, style="Card.TFrame"); cell.pack(side="left", padx=(0,16))
-            ttk.Label(cell, text=label+":").pack(anchor="w")
-            ttk.Entry(cell, textvariable=var, width=22).pack(anchor="w")
-
-        f4 = ttk.Frame(top, style="Card.TFrame"); f4.pack(fill="x", pady=8, padx=8)
-        for lbl,var,a,b,st in [
-            ("Letra NOMBRE (pt)", self.name_fs, 6, 16, 0.5),
-            ("Letra SKU (pt)",    self.sku_fs,  5, 14, 0.5),
-            ("Letra CÓDIGO (pt)", self.code_fs, 6, 16, 0.5),
-            ("Altura Código (mm)",self.bar_h,   5, 14, 0.5),
-            ("Ancho Código (mm)", self.bar_w,   20, 50,0.5),
-        ]:
-            PlusMinus(f4, lbl, var, a, b, st, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-
-        f5 = ttk.Frame(top, style="Card.TFrame"); f5.pack(fill="x", pady=8, padx=8)
-        for lbl,var,a,b,st in [
-            ("Margen Izq (mm)", self.m_left, 0, 10, 0.5),
-            ("Margen Der (mm)", self.m_right,0, 10, 0.5),
-            ("Margen Arriba (mm)", self.m_top,0, 10, 0.5),
-            ("Margen Abajo (mm)",  self.m_bottom,0,10, 0.5),
-        ]:
-            PlusMinus(f5, lbl, var, a, b, st, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-
-        f6 = ttk.Frame(top, style="Card.TFrame"); f6.pack(fill="x", pady=8, padx=8)
-        PlusMinus(f6, "Espacio entre líneas Título (mm)", self.line_spacing, 2.0, 6.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-        PlusMinus(f6, "Espacio Título ↔ SKU (mm)", self.title_sku_space, 0.0, 6.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-        PlusMinus(f6, "Espacio después del SKU (mm)", self.sku_spacing, 0.0, 8.0, 0.2, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-
-        # (Se mantienen por si en el futuro reactivas el ajuste por ancho)
-        f7 = ttk.Frame(top, style="Card.TFrame"); f7.pack(fill="x", pady=8, padx=8)
-        PlusMinus(f7, "Ancho TÍTULO (mm)", self.title_max_w, 20.0, 50.0, 0.5, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-        PlusMinus(f7, "Ancho SKU (mm)",    self.sku_max_w,   20.0, 50.0, 0.5, on_change=self._safe_preview).pack(side="left", padx=(0,18))
-
-        actions = ttk.Frame(top, style="Card.TFrame"); actions.pack(fill="x", pady=10, padx=8)
-        ttk.Button(actions, text="Generar Vista Previa", command=self.preview).pack(side="left")
-        ttk.Button(actions, text="Generar PDF", command=self.generate).pack(side="left", padx=8)
-
-        preview_card = ttk.Frame(root, style="Card.TFrame"); preview_card.pack(fill="both", expand=True, pady=8, ipady=8, ipadx=8)
-        ttk.Label(preview_card, text="Vista previa (1 etiqueta):").pack(anchor="w")
-        self.preview_canvas = tk.Canvas(preview_card,
-                                        width=int(LABEL_W_MM*PREVIEW_SCALE),
-                                        height=int(LABEL_H_MM*PREVIEW_SCALE),
-                                        bg="#0b1220", highlightthickness=1, highlightbackground="#334155")
-        self.preview_canvas.pack(pady=10)
-
-        self.status = tk.StringVar(value="Listo. Ajusta con +/− y genera vista previa.")
-        ttk.Label(root, textvariable=self.status, style="Header.TLabel").pack(anchor="w", pady=(8,0))
-
-    # ---------- lógica ----------
-    def _safe_preview(self): 
-        try: self.preview()
-        except Exception: pass
-
-    def choose_csv(self):
-        p = filedialog.askopenfilename(title="Seleccionar CSV", filetypes=[("CSV","*.csv"),("Todos","*.*")])
-        if p:
-            self.csv_path.set(p)
-            try: self.df_cached = read_csv_any(Path(p)); self.status.set("CSV cargado. Puedes autodetectar columnas.")
-            except Exception as e: messagebox.showerror("Error", f"No se pudo leer el CSV:\n{e}")
-
-    def choose_folder(self):
-        f = filedialog.askdirectory(title="Seleccionar carpeta destino")
-        if f: self.out_folder.set(f)
-
-    def autodetect(self):
-        if not self.csv_path.get(): messagebox.showwarning("Falta CSV","Primero elige un archivo CSV."); return
-        try:
-            df = self.df_cached if self.df_cached is not None else read_csv_any(Path(self.csv_path.get()))
-            mapping, _ = map_columns(df, {
-                "nombre":self.col_nombre.get() or None,
-                "sku":self.col_sku.get() or None,
-                "barcode":self.col_barcode.get() or None,
-                "cantidad":self.col_cantidad.get() or None
-            })
-            rev = {norm_col(c):c for c in df.columns}
-            self.col_nombre.set(rev.get(mapping.get("nombre",""),""))
-            self.col_sku.set(rev.get(mapping.get("sku",""),""))
-            self.col_barcode.set(rev.get(mapping.get("barcode",""),""))
-            self.col_cantidad.set(rev.get(mapping.get("cantidad",""),""))
-            self.status.set("Columnas autodetectadas.")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo autodetectar:\n{e}")
-
-    def get_mapping_df(self):
-        if not self.csv_path.get(): raise RuntimeError("Selecciona primero un CSV.")
-        df = self.df_cached if self.df_cached is not None else read_csv_any(Path(self.csv_path.get()))
-        return map_columns(df, {
-            "nombre":self.col_nombre.get() or None, "sku":self.col_sku.get() or None,
-            "barcode":self.col_barcode.get() or None,"cantidad":self.col_cantidad.get() or None
-        })
-
-    def preview(self):
-        mapping, df = self.get_mapping_df()
-        if df.empty: messagebox.showwarning("CSV vacío","El archivo CSV no tiene filas."); return
-        r = df.iloc[0]
-        rec = {"nombre":str(r.get(mapping["nombre"],"")).strip(),
-               "sku":str(r.get(mapping["sku"],"")).strip(),
-               "barcode":re.sub(r"\D","", str(r.get(mapping["barcode"],"")).strip())}
-
-        img = build_preview_image(
-            rec,
-            name_fs=self.name_fs.get(), sku_fs=self.sku_fs.get(), code_fs=self.code_fs.get(),
-            bar_h_mm=self.bar_h.get(), bar_w_mm=self.bar_w.get(),
-            m_left_mm=self.m_left.get(), m_right_mm=self.m_right.get(),
-            m_top_mm=self.m_top.get(),   m_bottom_mm=self.m_bottom.get(),
-            line_spacing_mm=self.line_spacing.get(),
-            title_sku_space_mm=self.title_sku_space.get(),
-            sku_spacing_mm=self.sku_spacing.get(),
-            title_max_w_mm=self.title_max_w.get(),
-            sku_max_w_mm=self.sku_max_w.get()
-        )
-        self.preview_photo = ImageTk.PhotoImage(img)
-        self.preview_canvas.delete("all")
-        self.preview_canvas.create_image(0,0,anchor="nw", image=self.preview_photo)
-        self.status.set("Vista previa actualizada.")
-
-    def generate(self):
-        if not self.out_folder.get():
-            messagebox.showwarning("Falta carpeta","Selecciona una carpeta destino."); return
-        out_path = str(Path(self.out_folder.get()) / (self.out_filename.get() or "etiquetas_51x25mm.pdf"))
-
-        log_path = Path(out_path).with_suffix(".log")
-        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
-                            handlers=[logging.FileHandler(log_path, encoding="utf-8")])
+def label_form_key(rec, params: dict):
+    return (rec["nombre"] or "", rec["sku"] or "", rec["barcode"] or "",
+            rec.get("name_fs"), rec.get("sku_fs"), tuple(sorted(params.items())))
 
-        try:
-            base_font = register_reportlab_font()
-            mapping, df = self.get_mapping_df()
-            labels = build_labels(df, mapping)
-
-            W,H = LABEL_W_MM*mm, LABEL_H_MM*mm
-            c = pdf_canvas.Canvas(out_path, pagesize=(W,H))
-            for rec in labels:
-                draw_label_pdf(
-                    c, W, H, rec, base_font=base_font,
-                    name_fs=self.name_fs.get(), sku_fs=self.sku_fs.get(), code_fs=self.code_fs.get(),
-                    bar_h_mm=self.bar_h.get(), bar_w_mm=self.bar_w.get(),
-                    m_left_mm=self.m_left.get(), m_right_mm=self.m_right.get(),
-                    m_top_mm=self.m_top.get(),   m_bottom_mm=self.m_bottom.get(),
-                    line_spacing_mm=self.line_spacing.get(),
-                    title_sku_space_mm=self.title_sku_space.get(),
-                    sku_spacing_mm=self.sku_spacing.get(),
-                    title_max_w_mm=self.title_max_w.get(),
-                    sku_max_w_mm=self.sku_max_w.get()
-                )
-                c.showPage()
-            c.save()
-            messagebox.showinfo("Éxito", f"PDF generado:\n{out_path}\nLog:\n{log_path}")
-            self.status.set("PDF generado correctamente.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Ocurrió un error:\n{e}")
-            self.status.set("Error en la generación.")
+def draw_label_form(c, W, H, rec, forms: dict, **params):
+    """
+    Igual que draw_label_pdf, pero como Form XObject reutilizable: cada etiqueta distinta
+    (nombre, sku, barcode + parámetros de diseño) se dibuja una sola vez y las copias
+    solo la referencian. `forms` ({clave: nombre_form}) se comparte en todo el documento.
+    """
+    key = label_form_key(rec, params)
+    name = forms.get(key)
+    if name is None:
+        name = f"lbl{len(forms)}"
+        c.beginForm(name, 0, 0, W, H)
+        draw_label_pdf(c, W, H, rec, **params)
+        c.endForm()
+        forms[key] = name
+    c.doForm(name)
+
+# ================== Autoajuste de título / SKU ==================
+def text_widths_pt(texts, base_font) -> np.ndarray:
+    """Ancho de cada texto a 1 pt (el ancho escala lineal con el tamaño); stringWidth una vez por texto distinto."""
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object), use_na_sentinel=False)
+    w = np.fromiter((pdfmetrics.stringWidth(str(t), base_font, 1.0) for t in uniques), float, len(uniques))
+    return w[codes]
+
+def _fit_sizes(texts, max_fs, avail_pt, base_font, min_fs):
+    """(tamaños, no_caben, anchos a 1 pt): mayor tamaño ≤ max_fs en pasos de FIT_STEP_PT que cabe en avail_pt."""
+    min_fs = min(min_fs, max_fs)        # un mínimo mayor que el configurado no agranda la letra
+    w1 = text_widths_pt(texts, base_font)
+    with np.errstate(divide="ignore"):
+        fs = np.minimum(np.where(w1 > 0, avail_pt / w1, np.inf), float(max_fs))
+    fs = np.floor(fs / FIT_STEP_PT + 1e-9) * FIT_STEP_PT
+    return np.maximum(fs, min_fs), fs < min_fs, w1
+
+def _fit_avail_pt(settings: LabelSettings) -> float:
+    return (LABEL_W_MM - float(settings.m_left_mm) - float(settings.m_right_mm)) * mm
+
+def fit_label_text(labels: LabelColumns, settings: LabelSettings, base_font="Helvetica",
+                   min_fs=FIT_MIN_FONT_PT, first_row=0) -> pd.DataFrame:
+    """
+    Autoajuste por lote: para cada fila el mayor tamaño de título y SKU (hasta name_fs /
+    sku_fs de settings) que cabe en el ancho útil, medido con la fuente del PDF. Lo guarda
+    en labels.name_fs / labels.sku_fs; draw_label_pdf, la vista previa y ZPL/EPL lo aplican
+    por etiqueta. Las filas que no caben ni con min_fs se dibujan a min_fs y se devuelven
+    en el reporte: fila (1 = primera fila de datos, + first_row), campo, texto, ancho_mm,
+    disponible_mm.
+    """
+    avail = _fit_avail_pt(settings)
+    rejected = []
+    for field, max_fs, attr in (("nombre", settings.name_fs, "name_fs"), ("sku", settings.sku_fs, "sku_fs")):
+        texts = getattr(labels, field)
+        fs, bad, w1 = _fit_sizes(texts, max_fs, avail, base_font, min_fs)
+        setattr(labels, attr, fs)
+        idx = np.flatnonzero(bad)
+        if len(idx):
+            rejected.append(pd.DataFrame({"fila": idx + first_row + 1, "campo": field,
+                                          "texto": np.asarray(texts, dtype=object)[idx],
+                                          "ancho_mm": np.round(w1[idx] * min_fs / mm, 1),
+                                          "disponible_mm": round(avail / mm, 1)}))
+    if not rejected:
+        return pd.DataFrame(columns=["fila", "campo", "texto", "ancho_mm", "disponible_mm"])
+    return pd.concat(rejected, ignore_index=True).sort_values(["fila", "campo"], kind="stable", ignore_index=True)
+
+def fit_record(rec: dict, settings: LabelSettings, base_font="Helvetica", min_fs=FIT_MIN_FONT_PT) -> dict:
+    """fit_label_text para un solo registro (vista previa); devuelve una copia con name_fs / sku_fs."""
+    avail = _fit_avail_pt(settings)
+    out = dict(rec)
+    out["name_fs"] = float(_fit_sizes([rec["nombre"] or ""], settings.name_fs, avail, base_font, min_fs)[0][0])
+    out["sku_fs"] = float(_fit_sizes([rec["sku"] or ""], settings.sku_fs, avail, base_font, min_fs)[0][0])
+    return out
 
-if __name__ == "__main__":
-    App().mainloop()
+def text_overflow(labels: LabelColumns, settings: LabelSettings, base_font="Helvetica", min_fs=None,
+                  widths=None) -> np.ndarray:
+    """
+    Máscara por fila: el título o el SKU no cabe en el ancho útil a name_fs / sku_fs o, con
+    autoajuste (min_fs), ni siquiera a min_fs. widths = (nombre, sku) a 1 pt ya medidos con
+    text_widths_pt, para no volver a medir el catálogo en cada cambio de diseño.
+    """
+    avail = _fit_avail_pt(settings) + 1e-6
+    if widths is None: widths = (text_widths_pt(labels.nombre, base_font), text_widths_pt(labels.sku, base_font))
+    bad = np.zeros(labels.rows, dtype=bool)
+    for w1, max_fs in zip(widths, (settings.name_fs, settings.sku_fs)):
+        fs = float(max_fs) if min_fs is None else min(float(min_fs), float(max_fs))
+        bad |= w1 * fs > avail
+    return bad
+
+def fit_report_path(out_path) -> Path:
+    p = Path(out_path)
+    return p.with_name(f"{p.stem}_no_caben.csv")
+
+def save_fit_report(report: pd.DataFrame, out_path, min_fs=FIT_MIN_FONT_PT) -> int:
+    """Escribe <salida>_no_caben.csv si hay filas que no caben; devuelve cuántas filas son."""
+    path = fit_report_path(out_path)
+    if report.empty:
+        if path.exists(): path.unlink()     # no dejar el reporte de una corrida anterior
+        logging.info("Autoajuste: todos los títulos y SKU caben")
+        return 0
+    report.to_csv(path, index=False, encoding="utf-8-sig")
+    n = report["fila"].nunique()
+    logging.warning("Autoajuste: %d filas no caben ni a %.1f pt; ver %s", n, min_fs, path)
+    return n
+
+# ================== Motor de generación ==================
+PROGRESS_EVERY = 200           # páginas entre avisos de progreso
+CHUNK_SIZE_DEFAULT = 1000      # etiquetas por bloque en modo paralelo
+CACHE_CHUNK_LABELS = 128       # etiquetas por bloque (promedio) con caché en disco
+CACHE_MAX_MB_DEFAULT = 512
+CACHE_DIR_DEFAULT = Path.home() / ".cache" / "etiquetas_51x25"
+RENDER_VERSION = 1             # subir al cambiar el dibujo de la etiqueta (invalida la caché)
+
+def write_labels_pdf(out, labels, params: dict, progress=None, total=None, sheet=None) -> int:
+    """
+    PDF secuencial: una página por etiqueta, copias repetidas vía draw_label_form.
+    Con sheet (SheetLayout) las etiquetas se acomodan en cuadrícula, varias por hoja;
+    None en `labels` deja la celda vacía.
+    `out` es una ruta o un archivo binario; `labels` cualquier iterable de registros.
+    progress(hechas, total) se llama cada PROGRESS_EVERY etiquetas y al final.
+    Devuelve el número de etiquetas escritas.
+    """
+    W,H = LABEL_W_MM*mm, LABEL_H_MM*mm
+    out = str(out) if isinstance(out, Path) else out
+    forms = {}   # una Form XObject por etiqueta distinta; las copias solo la referencian
+    n = 0
+    if sheet is None:
+        c = pdf_canvas.Canvas(out, pagesize=(W,H))
+        for rec in labels:
+            draw_label_form(c, W, H, rec, forms, **params)
+            c.showPage(); n += 1
+            if progress and n % PROGRESS_EVERY == 0: progress(n, total)
+    else:
+        pw, ph = sheet.page_size_mm()
+        c = pdf_canvas.Canvas(out, pagesize=(pw*mm, ph*mm))
+        per_sheet = sheet.per_sheet()
+        origins = [sheet.cell_origin(i) for i in range(per_sheet)]
+        cell = 0
+        for rec in itertools.chain(itertools.repeat(None, sheet.start), labels):
+            if rec is not None:
+                c.saveState(); c.translate(*origins[cell])
+                draw_label_form(c, W, H, rec, forms, **params)
+                c.restoreState(); n += 1
+                if progress and n % PROGRESS_EVERY == 0: progress(n, total)
+            cell += 1
+            if cell == per_sheet: c.showPage(); cell = 0
+        if cell: c.showPage()
+    with STATS.timer("c.save"): c.save()
+    STATS.count("etiquetas", n); STATS.count("etiquetas distintas", len(forms))
+    logging.debug("PDF: %d etiquetas (%d distintas)", n, len(forms))
+    if progress: progress(n, total)
+    return n
+
+def _chunks(iterable, size: int):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk: return
+        yield chunk
+
+def _label_key(rec) -> str:
+    if rec is None: return ""
+    return "\x1f".join((rec["nombre"] or "", rec["sku"] or "", rec["barcode"] or "",
+                        repr(rec.get("name_fs")), repr(rec.get("sku_fs"))))
+
+def _content_chunks(labels, avg: int, align=1):
+    """
+    Bloques definidos por contenido (como rsync): se corta después de una etiqueta cuyo
+    crc32 cae en 1/avg, así cambiar o insertar filas solo altera los bloques vecinos y el
+    resto conserva su clave en la caché. align: cortar solo en múltiplos (hojas completas).
+    """
+    every = max(1, avg // align)
+    lo, hi = max(align, avg // 4), max(align, avg * 4)
+    chunk = []
+    for rec in labels:
+        chunk.append(rec)
+        k = len(chunk)
+        if k % align: continue
+        if k >= hi or (k >= lo and zlib.crc32(_label_key(rec).encode("utf-8")) % every == 0):
+            yield chunk; chunk = []
+    if chunk: yield chunk
+
+class LabelCache:
+    """
+    Caché en disco direccionada por contenido: cada bloque de etiquetas ya dibujado (un
+    PDF chico de write_labels_pdf, con sus Form XObjects, barras vectoriales o PNG y la
+    fuente) se guarda como <dir>/ab/<sha256>.pdf. La clave cubre registros, parámetros de
+    diseño, hoja, archivo de fuente, versión de ReportLab y RENDER_VERSION. Al pasar de
+    max_bytes se borran los menos usados (mtime se actualiza en cada acierto).
+    Se puede pasar a los procesos del pool; evict() y stats() se llaman en el principal.
+    """
+    def __init__(self, path=CACHE_DIR_DEFAULT, max_bytes=CACHE_MAX_MB_DEFAULT << 20):
+        self.path, self.max_bytes = Path(path), int(max_bytes)
+        self.hits = self.misses = self.written_bytes = self.evicted = 0
+
+    def key(self, chunk, params: dict, sheet=None) -> str:
+        font = FONTS.path
+        font_id = (font, os.path.getsize(font), int(os.path.getmtime(font))) if font else None
+        h = hashlib.sha256(repr((RENDER_VERSION, reportlab.Version, font_id,
+                                 sorted(params.items()), sheet)).encode("utf-8"))
+        for rec in chunk: h.update(_label_key(rec).encode("utf-8")); h.update(b"\x1e")
+        return h.hexdigest()
+
+    def _file(self, key) -> Path:
+        return self.path / key[:2] / f"{key}.pdf"
+
+    def get(self, key):
+        f = self._file(key)
+        try: data = f.read_bytes()
+        except OSError: return None
+        try: os.utime(f)
+        except OSError: pass
+        return data
+
+    def put(self, key, data: bytes):
+        f = self._file(key)
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_name(f"{f.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data); os.replace(tmp, f)
+
+    def _entries(self):
+        if not self.path.is_dir(): return []
+        out = []
+        for d in os.scandir(self.path):
+            if not d.is_dir(): continue
+            for e in os.scandir(d.path):
+                if e.name.endswith(".pdf"):
+                    st = e.stat(); out.append((st.st_mtime, st.st_size, e.path))
+        return out
+
+    def evict(self) -> int:
+        """Borra los bloques menos usados hasta quedar en max_bytes; devuelve cuántos."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        n = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            try: os.remove(path)
+            except OSError: continue
+            total -= size; n += 1
+        self.evicted += n
+        return n
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"hits": self.hits, "misses": self.misses, "written_bytes": self.written_bytes, "evicted": self.evicted,
+                "entries": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+def _render_chunk_pdf(chunk, params: dict, sheet=None, instrument=False, cache=None):
+    """
+    Dibuja un bloque → (etiquetas, bytes del PDF, STATS del proceso o None, acierto de caché).
+    instrument=True solo en los procesos del pool: mide el bloque y devuelve sus STATS.
+    """
+    if instrument: STATS.reset(enabled=True)
+    key = cache.key(chunk, params, sheet) if cache is not None else None
+    data = cache.get(key) if key else None
+    hit = data is not None
+    if hit:
+        n = sum(rec is not None for rec in chunk)
+    else:
+        buf = io.BytesIO()
+        n = write_labels_pdf(buf, chunk, params, sheet=sheet)
+        data = buf.getvalue()
+        if key:
+            with STATS.timer("caché escribir"): cache.put(key, data)
+    return n, data, (STATS.snapshot() if instrument else None), hit
+
+_REF_RE = re.compile(rb"(\d+) 0 R\b")
+_SUBSET_RE = re.compile(rb"/(BaseFont|FontName) /([A-Z]{6})\+")
+
+def _subset_tag(part: int, tag: bytes) -> bytes:
+    """Prefijo de subconjunto TTF propio de cada bloque (ReportLab numera desde AAAAAA en cada uno)."""
+    h = int.from_bytes(hashlib.blake2b(b"%d/%s" % (part, tag), digest_size=8).digest(), "big")
+    return bytes(65 + h // 26**k % 26 for k in range(6))
+
+def _pdf_objects(data: bytes):
+    """
+    {número: bytes del objeto sin la cabecera 'N 0 obj'} + trailer, leyendo la
+    tabla xref clásica que escribe ReportLab.
+    """
+    sx = int(data[data.rindex(b"startxref")+9:].split()[0])
+    head, _, rest = data[sx:].partition(b"trailer")
+    lines = head.split(b"\n")
+    first, count = map(int, lines[1].split())
+    offs = {first+i: int(l[:10]) for i, l in enumerate(lines[2:2+count]) if l[17:18] == b"n"}
+    ends = sorted(offs.values()) + [sx]
+    nxt = {a: b for a, b in zip(ends, ends[1:])}
+    objs = {}
+    for num, off in offs.items():
+        body = data[off:nxt[off]]
+        objs[num] = body[body.index(b"obj")+3:body.rindex(b"endobj")].strip(b"\r\n") + b"\n"
+    return objs, rest
+
+def _merge_reportlab_pdfs(parts, out):
+    """
+    Une PDFs generados por write_labels_pdf en uno solo, en orden, copiando los
+    objetos tal cual (solo se renumeran las referencias). Mucho más barato que
+    reinterpretar cada página; pensado solo para la salida de ReportLab. Los subconjuntos
+    de la TTF se renombran por bloque: todos se llaman AAAAAA+DejaVuSans con glifos
+    distintos, y los visores que los unifican por nombre muestran caracteres equivocados.
+    """
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets, kids, next_num = {}, [], 3          # 1 = Catalog, 2 = Pages
+    for part, data in enumerate(parts):
+        objs, trailer = _pdf_objects(data)
+        root = int(re.search(rb"/Root (\d+) 0 R", trailer).group(1))
+        info = re.search(rb"/Info (\d+) 0 R", trailer)
+        pages = int(re.search(rb"/Pages (\d+) 0 R", objs[root]).group(1))
+        skip = {root, pages} | ({int(info.group(1))} if info else set())
+        remap = {pages: 2}
+        for num in sorted(objs):
+            if num not in skip: remap[num] = next_num; next_num += 1
+        fix = lambda m: b"%d 0 R" % remap[int(m.group(1))]
+        subset = lambda m: b"/%s /%s+" % (m.group(1), _subset_tag(part, m.group(2)))
+        kids += [remap[int(k)] for k in re.findall(rb"(\d+) 0 R", re.search(rb"/Kids \[(.*?)\]", objs[pages], re.S).group(1))]
+        for num in sorted(objs):
+            if num in skip: continue
+            body = objs[num]
+            cut = body.find(b"stream\r\n") if b"stream" in body else -1
+            if cut < 0: cut = body.find(b"stream\n")
+            head, tail = (body, b"") if cut < 0 else (body[:cut], body[cut:])
+            offsets[remap[num]] = out.tell()
+            out.write(b"%d 0 obj\n" % remap[num] + _SUBSET_RE.sub(subset, _REF_RE.sub(fix, head)) + tail + b"endobj\n")
+    offsets[1] = out.tell(); out.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    offsets[2] = out.tell()
+    out.write(b"2 0 obj\n<< /Type /Pages /Count %d /Kids [ %s ] >>\nendobj\n"
+              % (len(kids), b" ".join(b"%d 0 R" % k for k in kids)))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % next_num)
+    out.write(b"".join(b"%010d 00000 n \n" % offsets[n] for n in range(1, next_num)))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_num, xref))
+
+def _ordered_map(ex, fn, items, window: int):
+    """
+    Como ex.map pero con a lo sumo `window` tareas en vuelo (no consume todo `items`).
+    Si se abandona a medias (error o cancelación) descarta las tareas que aún no empezaron.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(ex.submit(fn, *item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for f in pending: f.cancel()
+
+class GenerationCancelled(Exception):
+    """La generación se canceló (ver `cancel` en generate_pdf)."""
+
+def _cancellable(labels, cancel, every=64):
+    for i, rec in enumerate(labels):
+        if i % every == 0 and cancel.is_set(): raise GenerationCancelled()
+        yield rec
+
+@contextlib.contextmanager
+def _atomic_output(out_path):
+    """Escribe en <salida>.part y lo renombra al terminar; si falla o se cancela no queda nada."""
+    tmp = f"{out_path}.part"
+    try:
+        yield tmp
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+def generate_pdf(out_path, labels, params: dict, *, workers=1, chunk_size=CHUNK_SIZE_DEFAULT,
+                 progress=None, total=None, stream=False, sheet=None, cancel=None, cache=None,
+                 executor=None) -> int:
+    """
+    Genera el PDF de etiquetas. Con workers > 1 divide las etiquetas en bloques de
+    chunk_size, cada proceso dibuja su bloque con draw_label_pdf y los bloques se
+    unen en el orden original (mismas páginas y orden que el modo secuencial).
+    stream=True usa el mismo esquema por bloques aun con un solo proceso: cada bloque
+    se vuelca al archivo en cuanto está listo, así la memoria no crece con el total.
+    sheet (SheetLayout) imprime varias etiquetas por hoja; los bloques se alinean a
+    hojas completas.
+    cancel (threading.Event): al activarse se lanza GenerationCancelled. El PDF se
+    escribe en un temporal y solo se renombra a out_path si termina bien.
+    cache (LabelCache): bloques definidos por contenido (~CACHE_CHUNK_LABELS etiquetas);
+    los que ya están en disco se reutilizan y solo se dibujan los nuevos o cambiados.
+    executor: ProcessPoolExecutor compartido (p. ej. el del servicio); con él `workers`
+    solo fija cuántos bloques van en vuelo y el pool no se cierra al terminar.
+    """
+    workers = max(1, int(workers or 1))
+    if executor is not None: workers = max(workers, 2)
+    if cancel is not None: labels = _cancellable(labels, cancel)
+    if workers == 1 and not stream and cache is None:
+        with _atomic_output(out_path) as tmp:
+            n = write_labels_pdf(tmp, labels, params, progress, total, sheet=sheet)
+        logging.info("PDF secuencial: %d etiquetas", n)
+        return n
+
+    chunk_size = max(1, int(chunk_size))
+    per_sheet = 1
+    if sheet is not None:
+        per_sheet = sheet.per_sheet()
+        chunk_size = -(-chunk_size // per_sheet) * per_sheet
+        labels = itertools.chain(itertools.repeat(None, sheet.start), labels)
+        sheet = replace(sheet, start=0)
+    chunks = (_content_chunks(labels, CACHE_CHUNK_LABELS, per_sheet) if cache is not None
+              else _chunks(labels, chunk_size))
+
+    done = 0
+    def parts():
+        nonlocal done
+        instrument = STATS.enabled and workers > 1
+        jobs = ((chunk, params, sheet, instrument, cache) for chunk in chunks)
+        with contextlib.ExitStack() as stack:
+            if executor is not None:
+                results = _ordered_map(executor, _render_chunk_pdf, jobs, window=2*workers)
+            elif workers > 1:
+                ex = stack.enter_context(ProcessPoolExecutor(workers, initializer=register_reportlab_font))
+                # si algo falla (o se cancela) no esperar a los bloques que siguen en cola
+                stack.push(lambda et, *_: et and ex.shutdown(wait=False, cancel_futures=True))
+                results = _ordered_map(ex, _render_chunk_pdf, jobs, window=2*workers)
+            else:
+                results = itertools.starmap(_render_chunk_pdf, jobs)
+            for n, data, snap, hit in results:
+                if snap: STATS.merge(snap)
+                if cache is not None:
+                    if hit: cache.hits += 1
+                    else: cache.misses += 1; cache.written_bytes += len(data)
+                yield data
+                done += n
+                if progress: progress(done, total)
+    with _atomic_output(out_path) as tmp, open(tmp, "wb") as f:
+        _merge_reportlab_pdfs(parts(), f)
+    logging.info("PDF por bloques: %d etiquetas, %d procesos, bloques de %d", done, workers,
+                 CACHE_CHUNK_LABELS if cache is not None else chunk_size)
+    if cache is not None:
+        cache.evict()
+        logging.info("Caché de etiquetas %s: %s", cache.path, cache.stats())
+    return done
+
+def run_generation(out_path, source, overrides: dict, settings: LabelSettings, *, workers=1,
+                   sheet=None, progress=None, cancel=None, stats=False, profile=None,
+                   auto_fit=False, fit_min_fs=FIT_MIN_FONT_PT, barcode_check=BARCODE_CHECK_DEFAULT,
+                   cache=None, executor=None) -> dict:
+    """
+    Trabajo completo de la interfaz: CSV (ruta o DataFrame ya leído) → registros → PDF.
+    progress(hechas, total, etiquetas/s, eta_s) informa el avance. Escribe en el log el
+    resumen de tiempos y devuelve {"labels", "seconds", "stages", "no_caben", "codigos_rechazados"}.
+    stats / profile: ver instrumentation(). auto_fit: ver fit_label_text.
+    barcode_check: modo de preflight_barcodes. cache / executor: ver generate_pdf.
+    """
+    with instrumentation(out_path, stats=stats, profile=profile):
+        return _run_generation(out_path, source, overrides, settings, workers=workers, sheet=sheet,
+                               progress=progress, cancel=cancel, auto_fit=auto_fit, fit_min_fs=fit_min_fs,
+                               barcode_check=barcode_check, cache=cache, executor=executor)
+
+def _run_generation(out_path, source, overrides, settings, *, workers, sheet, progress, cancel,
+                    auto_fit, fit_min_fs, barcode_check, cache, executor):
+    t = {}; t0 = last = time.perf_counter()
+    def lap(stage):
+        nonlocal last
+        now = time.perf_counter(); t[stage] = now - last; last = now
+
+    if isinstance(source, pd.DataFrame): mapping, df = map_columns(source, overrides)
+    else: mapping, df = read_table(source, overrides)
+    lap("leer archivo")
+    labels = label_columns(df, mapping);                                                lap("registros")
+    base_font = register_reportlab_font()
+    check = preflight_barcodes(labels, _text_column(df, mapping["barcode"]), barcode_check)
+    bad_codes = save_preflight_report(check, out_path, barcode_check);                  lap("códigos")
+    no_fit = 0
+    if auto_fit:
+        no_fit = save_fit_report(fit_label_text(labels, settings, base_font, fit_min_fs), out_path, fit_min_fs)
+        lap("autoajuste")
+    t_pdf = time.perf_counter()
+    def report(done, total):
+        el = time.perf_counter() - t_pdf
+        rate = done / el if el > 0 else 0.0
+        if progress: progress(done, total, rate, (total - done) / rate if rate and total else None)
+    n = generate_pdf(out_path, labels, settings.pdf_params(base_font), workers=workers,
+                     progress=report, total=len(labels), sheet=sheet, cancel=cancel, cache=cache,
+                     executor=executor)
+    lap("PDF")
+    total = last - t0
+    logging.info("Resumen: %d etiquetas en %.3f s (%.1f etiquetas/s) · %s", n, total,
+                 n / total if total else 0.0, ", ".join(f"{k}={v:.3f}s" for k, v in t.items()))
+    logging.info("Caché de códigos: %s", barcode_cache_stats())
+    logging.info("Fuentes: %s", FONTS.stats())
+    return {"labels": n, "seconds": total, "stages": t, "no_caben": no_fit, "codigos_rechazados": bad_codes}
+
+# ================== Impresoras térmicas (ZPL / EPL) ==================
+THERMAL_DPI_DEFAULT = 203
+PRINTER_PORT_DEFAULT = 9100
+EPL_FONTS_203 = {1: (8, 12), 2: (10, 16), 3: (12, 20), 4: (14, 24), 5: (32, 48)}   # ancho, alto (dots)
+
+def _dots(v_mm, dpi) -> int: return int(round(float(v_mm) * dpi / 25.4))
+
+def _thermal_geometry(rec, st: LabelSettings, dpi):
+    """
+    Posiciones en dots (desde arriba a la izquierda) equivalentes a draw_label_pdf:
+    baselines del título, SKU y código, y la caja del código de barras.
+    """
+    W = _dots(LABEL_W_MM, dpi); H = _dots(LABEL_H_MM, dpi)
+    y_title = float(st.m_top_mm)
+    y_sku   = y_title + float(st.line_spacing_mm) + float(st.title_sku_space_mm)
+    bc_top  = y_sku + float(st.sku_spacing_mm) + 2.0
+    usable_w = LABEL_W_MM - float(st.m_left_mm) - float(st.m_right_mm)
+    bc_w = min(float(st.bar_w_mm), usable_w)
+    code = re.sub(r"\D","", rec["barcode"] or "")
+    pattern = barcode_modules(code)
+    n_mod = len(pattern) if pattern else 0
+    mod = max(1, int(round(_dots(bc_w, dpi) / (n_mod + 2*BARCODE_QUIET_MODULES)))) if n_mod else 1
+    return dict(W=W, H=H, y_title=_dots(y_title, dpi), y_sku=_dots(y_sku, dpi),
+                bc_top=_dots(bc_top, dpi), bc_h=_dots(st.bar_h_mm, dpi), bc_w=_dots(bc_w, dpi),
+                y_code=_dots(LABEL_H_MM - float(st.m_bottom_mm) - 1.5, dpi),
+                x_left=_dots(st.m_left_mm, dpi), code=code, n_mod=n_mod, mod=mod)
+
+def _zpl_field(text: str) -> str:
+    return (text or "").replace("\\", "\\5C").replace("^", "\\5E").replace("~", "\\7E")
+
+def zpl_label(rec, st: LabelSettings, copies=1, dpi=THERMAL_DPI_DEFAULT) -> str:
+    """
+    Una etiqueta en ZPL con el diseño de draw_label_pdf: textos centrados (^FB) y el
+    código nativo de la impresora (^BE EAN-13 / ^BC Code128); las copias van en ^PQ.
+    """
+    g = _thermal_geometry(rec, st, dpi)
+    out = ["^XA", "^CI28", f"^PW{g['W']}", f"^LL{g['H']}", "^LH0,0"]
+    def text(baseline, pt, value):
+        h = max(10, int(round(float(pt) * dpi / 72)))
+        out.append(f"^FO0,{max(0, baseline - int(h*0.8))}^A0N,{h}^FB{g['W']},1,0,C,0"
+                   f"^FH\\^FD{_zpl_field(value)}^FS")
+    text(g["y_title"], rec.get("name_fs", st.name_fs), rec["nombre"] or "")
+    text(g["y_sku"], rec.get("sku_fs", st.sku_fs), rec["sku"] or "")
+    if g["n_mod"]:
+        x = max(0, (g["W"] - g["n_mod"]*g["mod"]) // 2)
+        out.append(f"^BY{min(10, g['mod'])}^FO{x},{g['bc_top']}")
+        if barcode_type(g["code"]) == "ean13":
+            out.append(f"^BEN,{g['bc_h']},N,N^FD{g['code'][:12]}^FS")
+        else:
+            out.append(f"^BCN,{g['bc_h']},N,N,N,A^FH\\^FD{_zpl_field(g['code'])}^FS")
+    else:   # mismo bloque negro que make_barcode_image / draw_barcode_vector
+        x = max(0, (g["W"] - g["bc_w"]) // 2)
+        out.append(f"^FO{x},{g['bc_top']}^GB{g['bc_w']},{g['bc_h']},{min(g['bc_w'], g['bc_h'])}^FS")
+    text(g["y_code"], st.code_fs, g["code"])
+    out.append(f"^PQ{int(copies)},0,1,Y^XZ")
+    return "\n".join(out) + "\n"
+
+def _epl_font(pt, dpi):
+    target = float(pt) * dpi / 72
+    k = dpi / 203
+    best = min(EPL_FONTS_203, key=lambda f: abs(EPL_FONTS_203[f][1]*k - target))
+    w, h = EPL_FONTS_203[best]
+    return best, int(round(w*k)), int(round(h*k))
+
+def _epl_str(text: str) -> str:
+    return '"' + (text or "").replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def epl_label(rec, st: LabelSettings, copies=1, dpi=THERMAL_DPI_DEFAULT) -> str:
+    """
+    Una etiqueta en EPL2 con el mismo diseño que zpl_label (fuentes residentes 1–5,
+    centrado calculado con el ancho fijo de la fuente); las copias van en P.
+    """
+    g = _thermal_geometry(rec, st, dpi)
+    out = ["", "N", f"q{g['W']}", f"Q{g['H']},24"]
+    def text(baseline, pt, value):
+        font, cw, ch = _epl_font(pt, dpi)
+        x = max(0, (g["W"] - len(value)*(cw + 2)) // 2)
+        out.append(f"A{x},{max(0, baseline - ch)},0,{font},1,1,N,{_epl_str(value)}")
+    text(g["y_title"], rec.get("name_fs", st.name_fs), rec["nombre"] or "")
+    text(g["y_sku"], rec.get("sku_fs", st.sku_fs), rec["sku"] or "")
+    if g["n_mod"]:
+        x = max(0, (g["W"] - g["n_mod"]*g["mod"]) // 2)
+        kind, data = ("E30", g["code"][:12]) if barcode_type(g["code"]) == "ean13" else ("1", g["code"])
+        out.append(f"B{x},{g['bc_top']},0,{kind},{g['mod']},{2*g['mod']},{g['bc_h']},N,{_epl_str(data)}")
+    else:
+        x = max(0, (g["W"] - g["bc_w"]) // 2)
+        out.append(f"LO{x},{g['bc_top']},{g['bc_w']},{g['bc_h']}")
+    text(g["y_code"], st.code_fs, g["code"])
+    out.append(f"P{int(copies)}")
+    return "\n".join(out) + "\n"
+
+THERMAL_FORMATS = {"zpl": zpl_label, "epl": epl_label}
+
+def label_runs(labels):
+    """
+    (registro, copias) agrupando copias consecutivas idénticas. Con LabelColumns
+    usa directamente la columna cantidad.
+    """
+    if isinstance(labels, LabelColumns):
+        for i in np.flatnonzero(labels.cantidad):
+            yield labels.record(i), int(labels.cantidad[i])
+        return
+    key = lambda r: (r["nombre"], r["sku"], r["barcode"])
+    for _, grp in itertools.groupby(labels, key=key):
+        first = next(grp)
+        yield first, 1 + sum(1 for _ in grp)
+
+@contextlib.contextmanager
+def open_printer_output(dest):
+    """
+    Destino binario para ZPL/EPL: "tcp://host[:puerto]" (puerto RAW 9100 por defecto)
+    o una ruta de archivo.
+    """
+    dest = str(dest)
+    if dest.startswith("tcp://"):
+        host, _, port = dest[6:].rstrip("/").partition(":")
+        with socket.create_connection((host, int(port or PRINTER_PORT_DEFAULT)), timeout=30) as sock:
+            with sock.makefile("wb") as f:
+                yield f
+    else:
+        with open(dest, "wb") as f:
+            yield f
+
+def write_thermal(labels, dest, settings: LabelSettings, fmt="zpl", dpi=THERMAL_DPI_DEFAULT,
+                  progress=None, total=None):
+    """
+    Envía las etiquetas como ZPL/EPL a `dest` (archivo o tcp://), una orden por etiqueta
+    distinta consecutiva con su cantidad de copias. Devuelve (copias, bytes).
+    """
+    render = THERMAL_FORMATS[fmt]
+    encoding = "utf-8" if fmt == "zpl" else "latin-1"
+    done = sent = 0
+    with open_printer_output(dest) as f:
+        for rec, copies in label_runs(labels):
+            data = render(rec, settings, copies, dpi).encode(encoding, errors="replace")
+            f.write(data); sent += len(data); done += copies
+            if progress: progress(done, total)
+    logging.info("%s -> %s: %d etiquetas, %d bytes", fmt.upper(), dest, done, sent)
+    return done, sent
+
+# ================== Raster 1 bit (TIFF / PNG) ==================
+RASTER_FORMATS = ("tiff", "png")
+RASTER_BATCH = 64             # etiquetas distintas por tarea en paralelo
+RASTER_DEDUP_MB = 64          # bitmaps ya dibujados que se reutilizan para copias repetidas más adelante
+
+def render_label_bitmap(rec, layout: dict, dpi=THERMAL_DPI_DEFAULT) -> Image.Image:
+    """Etiqueta en 1 bit a `dpi` con el diseño de build_preview_image (fondo blanco, sin marco)."""
+    img = build_preview_image(rec, scale=dpi / 25.4, frame=False, **layout)
+    return img.convert("1", dither=Image.Dither.NONE)
+
+def encode_page(img: Image.Image, fmt="tiff", dpi=THERMAL_DPI_DEFAULT):
+    """
+    Página codificada: "png" → bytes del PNG; "tiff" → ((ancho, alto, fotométrica, filas
+    por tira), [tiras CCITT G4]) para MultipageTiffWriter. La compresión la hace Pillow.
+    """
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG", dpi=(dpi, dpi))
+        return buf.getvalue()
+    img.save(buf, format="TIFF", compression="group4", dpi=(dpi, dpi))
+    data = buf.getvalue()
+    tags = _tiff_tags(data, (262, 273, 278, 279))
+    strips = [data[o:o+n] for o, n in zip(tags[273], tags[279])]
+    return (img.width, img.height, tags.get(262, (0,))[0], tags.get(278, (img.height,))[0]), strips
+
+def _tiff_tags(data: bytes, wanted) -> dict:
+    """Valores (tupla) de algunos tags SHORT/LONG de la primera IFD, sin pasar por Image.open."""
+    end = "<" if data[:2] == b"II" else ">"
+    (ifd,) = struct.unpack_from(end + "I", data, 4)
+    (n,) = struct.unpack_from(end + "H", data, ifd)
+    out = {}
+    for pos in range(ifd + 2, ifd + 2 + 12*n, 12):
+        tag, typ, count, value = struct.unpack_from(end + "HHII", data, pos)
+        if tag not in wanted: continue
+        fmt = end + str(count) + ("H" if typ == 3 else "I")
+        out[tag] = struct.unpack_from(fmt, data, pos + 8 if struct.calcsize(fmt) <= 4 else value)
+    return out
+
+def _page_nbytes(page) -> int:
+    return len(page) if isinstance(page, bytes) else sum(map(len, page[1]))
+
+def _render_pages(recs, layout: dict, dpi, fmt):
+    """Tarea del pool: dibuja y codifica cada registro (se devuelven bytes, no imágenes)."""
+    return [encode_page(render_label_bitmap(rec, layout, dpi), fmt, dpi) for rec in recs]
+
+def iter_label_pages(labels, settings: LabelSettings, dpi=THERMAL_DPI_DEFAULT, fmt="tiff", *, workers=1):
+    """
+    (página codificada, copias) por cada tramo de copias idénticas (label_runs), en orden.
+    Cada etiqueta distinta se dibuja y codifica una sola vez: las copias comparten la página
+    y una etiqueta que reaparece más adelante se toma de un LRU de RASTER_DEDUP_MB. Con
+    workers > 1 los lotes de RASTER_BATCH etiquetas se dibujan en procesos.
+    """
+    layout, workers = settings.layout(), max(1, int(workers or 1))
+    seen = LRUCache(max_items=1 << 20, max_bytes=RASTER_DEDUP_MB << 20, sizeof=_page_nbytes)
+    metas = deque()
+    def jobs():
+        for batch in _chunks(label_runs(labels), RASTER_BATCH):
+            keys = [_label_key(rec) for rec, _ in batch]
+            have, todo = {}, {}
+            for k, (rec, _) in zip(keys, batch):
+                if k in have or k in todo: continue
+                page = seen.get(k)
+                if page is not None: have[k] = page
+                else: todo[k] = rec
+            metas.append((batch, keys, have, list(todo)))
+            yield list(todo.values()), layout, dpi, fmt
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            ex = stack.enter_context(ProcessPoolExecutor(workers))
+            stack.push(lambda et, *_: et and ex.shutdown(wait=False, cancel_futures=True))
+            results = _ordered_map(ex, _render_pages, jobs(), window=2*workers)
+        else:
+            results = itertools.starmap(_render_pages, jobs())
+        for rendered in results:
+            batch, keys, have, todo = metas.popleft()
+            for k, page in zip(todo, rendered):
+                have[k] = page; seen.put(k, page)
+            for k, (_, copies) in zip(keys, batch):
+                yield have[k], copies
+    logging.info("Raster %d dpi: %s", dpi, seen.stats())
+
+class MultipageTiffWriter:
+    """
+    TIFF multipágina en un solo pase, con páginas ya codificadas por encode_page
+    (AppendingTiffWriter de Pillow relee todas las IFD anteriores en cada página nueva, y
+    eso es cuadrático). Las copias de una página comparten las mismas tiras en el archivo:
+    solo se agrega una IFD por copia.
+    """
+    def __init__(self, f, dpi):
+        self.f, self.dpi = f, int(dpi)
+        f.write(b"II*\x00\x00\x00\x00\x00")
+        self._link = 4            # dónde va el offset de la próxima IFD
+
+    def add(self, page, copies=1):
+        _, strips = page
+        offsets = []
+        for s in strips:
+            offsets.append(self.f.tell()); self.f.write(s)
+        for _ in range(copies): self._ifd(page[0], offsets, [len(s) for s in strips])
+
+    def _ifd(self, geometry, offsets, counts):
+        f = self.f; w, h, photometric, rows = geometry; n = len(offsets)
+        if f.tell() % 2: f.write(b"\x00")
+        arrays = f.tell()
+        if n > 1: f.write(struct.pack(f"<{2*n}I", *offsets, *counts))
+        res = f.tell(); f.write(struct.pack("<II", self.dpi, 1))
+        ifd = f.tell()
+        # (tag, tipo: 3 SHORT / 4 LONG / 5 RATIONAL, cantidad, valor u offset), en orden de tag
+        entries = [(254, 4, 1, 2), (256, 4, 1, w), (257, 4, 1, h), (258, 3, 1, 1), (259, 3, 1, 4),
+                   (262, 3, 1, photometric), (273, 4, n, offsets[0] if n == 1 else arrays),
+                   (277, 3, 1, 1), (278, 4, 1, rows), (279, 4, n, counts[0] if n == 1 else arrays + 4*n),
+                   (282, 5, 1, res), (283, 5, 1, res), (296, 3, 1, 2)]
+        f.write(struct.pack("<H", len(entries)))
+        for e in entries: f.write(struct.pack("<HHII", *e))
+        link = f.tell(); f.write(b"\x00\x00\x00\x00")
+        f.seek(self._link); f.write(struct.pack("<I", ifd)); f.seek(0, os.SEEK_END)
+        self._link = link
+
+def raster_page_path(out_path, n: int, digits=5) -> Path:
+    """<salida>_00001.png, <salida>_00002.png … (una imagen por copia, numeradas desde 1)."""
+    p = Path(out_path)
+    return p.with_name(f"{p.stem}_{n:0{digits}d}{p.suffix or '.png'}")
+
+def write_raster(labels, out_path, settings: LabelSettings, fmt="tiff", dpi=THERMAL_DPI_DEFAULT, *,
+                 workers=1, progress=None, total=None, cancel=None):
+    """
+    Etiquetas como imágenes de 1 bit a `dpi` (203 / 300 / 600), para hosts de impresión
+    que reciben raster. fmt "tiff": un solo TIFF multipágina en CCITT G4, una página por
+    copia (MultipageTiffWriter). fmt "png": secuencia numerada (raster_page_path).
+    Devuelve (copias, bytes).
+    """
+    if cancel is not None: labels = _cancellable(labels, cancel)
+    pages = iter_label_pages(labels, settings, dpi, fmt, workers=workers)
+    done = sent = 0
+    if fmt == "tiff":
+        with _atomic_output(out_path) as tmp, open(tmp, "wb") as f:
+            tiff = MultipageTiffWriter(f, dpi)
+            for page, copies in pages:
+                tiff.add(page, copies); done += copies
+                if progress: progress(done, total)
+        sent = os.path.getsize(out_path)
+    else:
+        digits = max(5, len(str(total))) if total else 6
+        written = []
+        try:
+            for page, copies in pages:
+                for _ in range(copies):
+                    done += 1
+                    path = raster_page_path(out_path, done, digits)
+                    path.write_bytes(page); written.append(path); sent += len(page)
+                if progress: progress(done, total)
+        except BaseException:
+            for path in written: path.unlink(missing_ok=True)     # no dejar una secuencia a medias
+            raise
+    logging.info("%s -> %s: %d etiquetas a %d dpi, %d bytes", fmt.upper(), out_path, done, dpi, sent)
+    return done, sent
+
+# ================== CLI (sin interfaz) ==================
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="python -m gui_generate_barcode",
+        description="Genera el PDF de etiquetas 51×25 mm desde un CSV (o Parquet, Excel, JSON Lines), sin interfaz gráfica.")
+    ap.add_argument("csv", type=Path, help="archivo de entrada: CSV, Parquet, Excel (.xlsx) o JSON Lines (.jsonl)")
+    ap.add_argument("-o", "--output", default="etiquetas_51x25mm.pdf",
+                    help="archivo de salida; con ZPL/EPL también tcp://host[:puerto]")
+    ap.add_argument("--format", choices=("pdf", *THERMAL_FORMATS, *RASTER_FORMATS), default="pdf",
+                    help="pdf, comandos nativos para impresoras térmicas (zpl/epl) o imágenes de 1 bit: "
+                         "tiff (multipágina, CCITT G4) o png (<salida>_00001.png, …)")
+    ap.add_argument("--dpi", type=int, default=THERMAL_DPI_DEFAULT,
+                    help="resolución de la impresora (ZPL/EPL/TIFF/PNG: 203, 300, 600…)")
+    cols = ap.add_argument_group("columnas (por defecto se autodetectan)")
+    for k in CANDIDATES:
+        cols.add_argument(f"--col-{k}", dest=f"col_{k}", metavar="COLUMNA")
+    lay = ap.add_argument_group("diseño")
+    for f in fields(LabelSettings):
+        if f.name == "bar_mode":
+            lay.add_argument("--bar-mode", choices=BARCODE_MODES, default=f.default)
+        else:
+            lay.add_argument("--" + f.name.replace("_", "-"), type=float, default=f.default, metavar="N")
+    sh = ap.add_argument_group("hoja (varias etiquetas por página)")
+    sh.add_argument("--sheet", metavar="HOJA",
+                    help=f"{' / '.join(SHEET_SIZES_MM)} o ANCHOxALTO en mm (por defecto una etiqueta por página)")
+    for f in fields(SheetLayout):
+        if f.name != "page":
+            sh.add_argument("--" + f.name.replace("_", "-"), type=type(f.default), default=f.default, metavar="N")
+    cols.add_argument("--barcode-check", choices=BARCODE_CHECK_MODES, default=BARCODE_CHECK_DEFAULT,
+                      help="revisión previa de códigos: report informa, repair corrige el dígito verificador, "
+                           "reject omite las filas con problema (reporte en <salida>_codigos_rechazados.csv)")
+    lay.add_argument("--auto-fit", action="store_true",
+                     help="reduce título y SKU por etiqueta hasta que quepan (máximo: --name-fs / --sku-fs)")
+    lay.add_argument("--fit-min-fs", type=float, default=FIT_MIN_FONT_PT, metavar="N",
+                     help="tamaño mínimo del autoajuste; las filas que no caben van a <salida>_no_caben.csv")
+    run = ap.add_argument_group("ejecución")
+    run.add_argument("--workers", type=int, default=1, help="procesos para el PDF o el raster (1 = secuencial)")
+    run.add_argument("--chunk-size", type=int, default=CHUNK_SIZE_DEFAULT, help="etiquetas por bloque en paralelo")
+    run.add_argument("--stream", action="store_true",
+                     help="lee el CSV por bloques y vuelca el PDF por bloques (memoria acotada)")
+    run.add_argument("--cache", type=Path, metavar="DIR", nargs="?", const=CACHE_DIR_DEFAULT,
+                     help=f"reutiliza bloques de etiquetas ya dibujados (por defecto {CACHE_DIR_DEFAULT})")
+    run.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_MB_DEFAULT, metavar="MB",
+                     help="tamaño máximo de la caché; se borran los bloques menos usados")
+    run.add_argument("--log", type=Path, help="archivo .log (por defecto junto al PDF)")
+    run.add_argument("--stats", action="store_true",
+                     help="mide cada etapa y escribe el histograma de tiempos en el log")
+    run.add_argument("--profile", choices=PROFILERS,
+                     help="perfila la ejecución y guarda el perfil junto al log (.prof / .stacks.txt)")
+    return ap
+
+def main(argv=None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    to_socket = args.output.startswith("tcp://")
+    if to_socket and args.format not in THERMAL_FORMATS:
+        build_arg_parser().error("tcp:// solo está disponible con --format zpl/epl")
+    log_path = args.log or (Path("etiquetas.log") if to_socket else Path(args.output).with_suffix(".log"))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                        handlers=[logging.FileHandler(log_path, encoding="utf-8")])
+    settings = LabelSettings(**{f.name: getattr(args, f.name) for f in fields(LabelSettings)})
+    overrides = {k: getattr(args, f"col_{k}") for k in CANDIDATES}
+    sheet = None
+    if args.sheet:
+        sheet = SheetLayout(page=args.sheet, **{f.name: getattr(args, f.name) for f in fields(SheetLayout) if f.name != "page"})
+        try: sheet.grid()
+        except ValueError as e: build_arg_parser().error(str(e))
+
+    with instrumentation(log_path, stats=args.stats, profile=args.profile):
+        n, size, t = _run_cli(args, overrides, settings, sheet, log_path)
+
+    total = sum(t.values())
+    print(f"{args.format.upper()}: {args.output}  ({n} etiquetas)")
+    for k, v in t.items(): print(f"  {k:<12} {v:8.3f} s")
+    print(f"  {'total':<12} {total:8.3f} s   {n/total if total else 0:,.1f} etiquetas/s"
+          f"   {size:,} bytes ({size/n if n else 0:,.0f} bytes/etiqueta)")
+    logging.info("CLI %s -> %s: %d etiquetas en %.3f s (%s)", args.csv, args.output, n, total,
+                 ", ".join(f"{k}={v:.3f}s" for k, v in t.items()))
+    return 0
+
+def _run_cli(args, overrides, settings, sheet, log_path):
+    t = {}; last = time.perf_counter()
+    def lap(stage):
+        nonlocal last
+        now = time.perf_counter(); t[stage] = now - last; last = now
+
+    base_font = register_reportlab_font()
+    checks, fits = [], []
+    def check(labels, df, first=0):
+        if args.barcode_check != "off":
+            raw = _text_column(df, mapping["barcode"])
+            checks.append(preflight_barcodes(labels, raw, args.barcode_check, first))
+    def fit(labels, df, first=0):
+        if args.auto_fit: fits.append(fit_label_text(labels, settings, base_font, args.fit_min_fs, first))
+    if args.stream:
+        mapping, frames = iter_table_chunks(args.csv, overrides);  lap("columnas")
+        prepare = lambda labels, df, first: (check(labels, df, first), fit(labels, df, first))
+        labels, n_total = iter_labels(frames, mapping, prepare=prepare), None
+    else:
+        mapping, df = read_table(args.csv, overrides);  lap("leer archivo")
+        labels = label_columns(df, mapping);       lap("registros")
+        check(labels, df);                         lap("códigos")
+        fit(labels, df);                           lap("autoajuste")
+        n_total = len(labels)
+    if args.format == "pdf":
+        cache = LabelCache(args.cache, args.cache_max_mb << 20) if args.cache else None
+        n = generate_pdf(args.output, labels, settings.pdf_params(base_font), workers=args.workers,
+                         chunk_size=args.chunk_size, total=n_total, stream=args.stream, sheet=sheet, cache=cache)
+        size = Path(args.output).stat().st_size
+        if cache is not None:
+            st = cache.stats()
+            print(f"Caché: {st['hits']} bloques reutilizados, {st['misses']} dibujados, "
+                  f"{st['entries']} en disco ({st['bytes']/2**20:,.1f} MB), {st['evicted']} borrados")
+    elif args.format in RASTER_FORMATS:
+        n, size = write_raster(labels, args.output, settings, args.format, args.dpi,
+                               workers=args.workers, total=n_total)
+    else:
+        n, size = write_thermal(labels, args.output, settings, args.format, args.dpi, total=n_total)
+    lap(args.format.upper())
+    bad = save_preflight_report(pd.concat(checks, ignore_index=True) if checks else pd.DataFrame(),
+                                log_path, args.barcode_check)
+    if bad: print(f"Códigos ({args.barcode_check}): {bad} filas con problemas → {preflight_report_path(log_path)}")
+    if args.auto_fit:
+        report = pd.concat(fits, ignore_index=True) if fits else pd.DataFrame()
+        no_fit = save_fit_report(report, log_path, args.fit_min_fs)
+        if no_fit: print(f"Autoajuste: {no_fit} filas no caben ni a {args.fit_min_fs:g} pt → {fit_report_path(log_path)}")
+    return n, size, t
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio local de etiquetas: varias estaciones envían trabajos por HTTP y comparten
+un solo pool de procesos (y la caché de etiquetas, si se activa).
+
+Endpoints:
+    POST   /jobs               CSV (text/csv), Parquet, Excel (.xlsx), JSON Lines o JSON {"records": [...], "settings": {...},
+                               "sheet": {...}, "columns": {...}}; los ajustes también
+                               pueden ir en la query (?name_fs=9&bar_mode=vector&sheet=A4).
+                               202 → {"id", "status", "status_url", "pdf_url"}
+                               429 si la cola está llena (Retry-After), 413 si es muy grande.
+    GET    /jobs/<id>          estado: queued / running / done / error / cancelled, avance y tiempos
+    GET    /jobs/<id>/pdf      el PDF terminado (?wait=SEGUNDOS espera a que termine)
+    GET    /jobs/<id>/no_caben.csv, /jobs/<id>/codigos_rechazados.csv   reportes del trabajo
+    DELETE /jobs/<id>          cancela el trabajo y borra su PDF
+    GET    /metrics            métricas en formato Prometheus (cola, latencias, etiquetas)
+    GET    /healthz
+
+Uso:
+    python server_generate_barcode.py --port 8765 --workers 4 --jobs 2 --queue 32
+    curl -X POST --data-binary @productos.csv -H "Content-Type: text/csv" \\
+         "http://127.0.0.1:8765/jobs?sheet=A4&auto_fit=1"
+"""
+
+import argparse, json, logging, os, shutil, tempfile, threading, time, uuid, queue
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+import gui_generate_barcode as gbc
+
+PORT_DEFAULT = 8765
+QUEUE_DEFAULT = 32                  # trabajos en espera antes de responder 429
+JOBS_DEFAULT = 2                    # trabajos generándose a la vez
+MAX_UPLOAD_MB_DEFAULT = 64
+KEEP_DEFAULT = 200                  # trabajos terminados que se conservan (PDF incluido)
+WAIT_MAX_S = 300                    # tope de ?wait= en /jobs/<id>/pdf
+LATENCY_BUCKETS_S = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+# Content-Type del cuerpo → extensión del archivo temporal (elige el lector de gbc.READERS)
+UPLOAD_SUFFIXES = {"application/vnd.apache.parquet": ".parquet", "application/x-parquet": ".parquet",
+                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+                   "application/x-ndjson": ".jsonl", "application/jsonl": ".jsonl"}
+
+class JobError(Exception):
+    """Petición inválida: se responde 400 con el mensaje."""
+
+def _number(value, name):
+    try: return float(value)
+    except (TypeError, ValueError): raise JobError(f"{name}: se esperaba un número, llegó {value!r}")
+
+def _flag(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+def _object(body: dict, key: str) -> dict:
+    """body[key] como dict ({} si falta); cualquier otro tipo es un 400, no un error del servidor."""
+    value = body.get(key)
+    if value is None: return {}
+    if not isinstance(value, dict): raise JobError(f'"{key}" debe ser un objeto {{…}}, llegó {type(value).__name__}')
+    return value
+
+def parse_options(query: dict, body: dict = None) -> dict:
+    """
+    Ajustes del trabajo desde la query y/o el JSON: campos de LabelSettings, hoja
+    (SheetLayout), columnas (col_nombre…) y auto_fit / fit_min_fs / barcode_check.
+    """
+    body = body or {}
+    q = {k: v[-1] for k, v in query.items()}
+    raw_settings = {**{k: v for k, v in q.items() if k in gbc.LabelSettings.__dataclass_fields__},
+                    **_object(body, "settings")}
+    settings = {}
+    for f in fields(gbc.LabelSettings):
+        if f.name not in raw_settings: continue
+        v = raw_settings.pop(f.name)
+        if f.name == "bar_mode":
+            if v not in gbc.BARCODE_MODES: raise JobError(f"bar_mode: use {' / '.join(gbc.BARCODE_MODES)}")
+            settings[f.name] = v
+        else:
+            settings[f.name] = _number(v, f.name)
+    if raw_settings: raise JobError(f"Ajustes desconocidos: {', '.join(sorted(raw_settings))}")
+
+    sheet_opts = dict(_object(body, "sheet"))
+    unknown = set(sheet_opts) - {f.name for f in fields(gbc.SheetLayout)}
+    if unknown: raise JobError(f"Campos de hoja desconocidos: {', '.join(sorted(unknown))}")
+    if "sheet" in q: sheet_opts.setdefault("page", q["sheet"])
+    for f in fields(gbc.SheetLayout):
+        if f.name != "page" and f.name in q: sheet_opts.setdefault(f.name, q[f.name])
+    sheet = None
+    if sheet_opts:
+        try:
+            sheet = gbc.SheetLayout(**{f.name: (type(f.default)(sheet_opts[f.name]) if f.name != "page" else sheet_opts[f.name])
+                                       for f in fields(gbc.SheetLayout) if f.name in sheet_opts})
+            sheet.grid()
+        except (TypeError, ValueError) as e:
+            raise JobError(f"Hoja inválida: {e}")
+
+    body_columns = _object(body, "columns")
+    unknown = set(body_columns) - set(gbc.CANDIDATES)
+    if unknown: raise JobError(f"Columnas desconocidas: {', '.join(sorted(unknown))} (use {', '.join(gbc.CANDIDATES)})")
+    if not all(v is None or isinstance(v, str) for v in body_columns.values()):
+        raise JobError('"columns": cada valor debe ser el nombre de una columna (texto)')
+    columns = {k: body_columns.get(k) or q.get(f"col_{k}") for k in gbc.CANDIDATES}
+    check = body.get("barcode_check", q.get("barcode_check", gbc.BARCODE_CHECK_DEFAULT))
+    if check not in gbc.BARCODE_CHECK_MODES:
+        raise JobError(f"barcode_check: use {' / '.join(gbc.BARCODE_CHECK_MODES)}")
+    return {"settings": gbc.LabelSettings(**settings), "sheet": sheet, "columns": columns,
+            "auto_fit": _flag(body.get("auto_fit", q.get("auto_fit", "0"))),
+            "fit_min_fs": _number(body.get("fit_min_fs", q.get("fit_min_fs", gbc.FIT_MIN_FONT_PT)), "fit_min_fs"),
+            "barcode_check": check}
+
+def records_frame(records) -> pd.DataFrame:
+    """JSON [{"nombre", "sku", "barcode", "cantidad"}, …] → DataFrame con los códigos como texto."""
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        raise JobError('"records" debe ser una lista no vacía de objetos')
+    keys = list(dict.fromkeys(k for r in records for k in r))
+    # columna por columna y como object: un código 7501234567895 junto a un null no pasa por float
+    return pd.DataFrame({k: pd.Series([r.get(k) for r in records], dtype=object) if k == "cantidad"
+                         else pd.Series(["" if r.get(k) is None else str(r.get(k)) for r in records], dtype=object)
+                         for k in keys})
+
+class Job:
+    __slots__ = ("id", "source", "options", "state", "error", "created", "started", "finished",
+                 "done", "total", "rate", "pdf", "cancel", "finished_ev", "result")
+
+    def __init__(self, source, options, pdf_path):
+        self.id = uuid.uuid4().hex[:12]
+        self.source, self.options, self.pdf = source, options, pdf_path
+        self.state, self.error, self.result = "queued", None, None
+        self.created, self.started, self.finished = time.time(), None, None
+        self.done = self.total = 0
+        self.rate = 0.0
+        self.cancel, self.finished_ev = threading.Event(), threading.Event()
+
+    def status(self) -> dict:
+        out = {"id": self.id, "status": self.state, "done": self.done, "total": self.total,
+               "labels_per_s": round(self.rate, 1), "created": self.created,
+               "queued_s": round((self.started or time.time()) - self.created, 3)}
+        if self.started: out["running_s"] = round((self.finished or time.time()) - self.started, 3)
+        if self.error: out["error"] = self.error
+        if self.result:
+            out.update(labels=self.result["labels"], stages=self.result["stages"],
+                       no_caben=self.result["no_caben"], codigos_rechazados=self.result["codigos_rechazados"])
+        return out
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_S):
+        self.buckets, self.counts, self.sum, self.n = buckets, [0] * len(buckets), 0.0, 0
+
+    def observe(self, v):
+        self.sum += v; self.n += 1
+        for i, b in enumerate(self.buckets):
+            if v <= b: self.counts[i] += 1
+
+    def lines(self, name, help_):
+        out = [f"# HELP {name} {help_}", f"# TYPE {name} histogram"]
+        out += [f'{name}_bucket{{le="{b}"}} {c}' for b, c in zip(self.buckets, self.counts)]
+        out += [f'{name}_bucket{{le="+Inf"}} {self.n}', f"{name}_sum {self.sum:.6f}", f"{name}_count {self.n}"]
+        return out
+
+class LabelService:
+    """
+    Cola acotada de trabajos + `jobs` hilos que los generan con run_generation sobre un
+    ProcessPoolExecutor compartido de `workers` procesos.
+    """
+    def __init__(self, data_dir: Path, *, workers=os.cpu_count() or 1, jobs=JOBS_DEFAULT,
+                 queue_size=QUEUE_DEFAULT, keep=KEEP_DEFAULT, cache=None):
+        self.data_dir, self.workers, self.keep, self.cache = Path(data_dir), max(1, workers), keep, cache
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=gbc.register_reportlab_font)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs, self.lock = {}, threading.Lock()
+        self.running = 0
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "error": 0, "cancelled": 0, "labels": 0}
+        self.wait_hist, self.run_hist = Histogram(), Histogram()
+        self.threads = [threading.Thread(target=self._loop, daemon=True, name=f"trabajo-{i}") for i in range(max(1, jobs))]
+        for t in self.threads: t.start()
+
+    # ---- cola
+    def submit(self, source, options) -> Job:
+        job = Job(source, options, None)
+        job.pdf = self.data_dir / f"{job.id}.pdf"
+        with self.lock:
+            try: self.queue.put_nowait(job)
+            except queue.Full:
+                self.counters["rejected"] += 1
+                raise
+            self.jobs[job.id] = job
+            self.counters["submitted"] += 1
+        return job
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos al rechazar por cola llena (promedio de ejecución × cola / hilos)."""
+        avg = self.run_hist.sum / self.run_hist.n if self.run_hist.n else 5.0
+        return max(1, int(avg * self.queue.qsize() / len(self.threads)))
+
+    def get(self, job_id):
+        with self.lock: return self.jobs.get(job_id)
+
+    def cancel(self, job_id) -> bool:
+        job = self.get(job_id)
+        if job is None: return False
+        job.cancel.set()
+        if job.finished_ev.is_set():
+            self._forget(job)
+        return True
+
+    def _forget(self, job):
+        with self.lock: self.jobs.pop(job.id, None)
+        for p in (job.pdf, *self._side_files(job)):
+            try: os.remove(p)
+            except OSError: pass
+        if isinstance(job.source, Path):
+            try: os.remove(job.source)
+            except OSError: pass
+
+    @staticmethod
+    def _side_files(job):
+        return (gbc.fit_report_path(job.pdf), gbc.preflight_report_path(job.pdf))
+
+    # ---- ejecución
+    def _loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None: return
+            try: self._run(job)
+            finally: self.queue.task_done()
+
+    def _run(self, job: Job):
+        if job.cancel.is_set():
+            job.state = "cancelled"; job.finished = time.time(); job.finished_ev.set()
+            with self.lock: self.counters["cancelled"] += 1
+            self._forget(job); return
+        job.state, job.started = "running", time.time()
+        with self.lock: self.running += 1
+        self.wait_hist.observe(job.started - job.created)
+        o = job.options
+        def progress(done, total, rate, eta):
+            job.done, job.total, job.rate = done, total, rate
+        try:
+            job.result = gbc.run_generation(
+                str(job.pdf), job.source, o["columns"], o["settings"], workers=self.workers, sheet=o["sheet"],
+                progress=progress, cancel=job.cancel, auto_fit=o["auto_fit"], fit_min_fs=o["fit_min_fs"],
+                barcode_check=o["barcode_check"], cache=self.cache, executor=self.pool)
+            job.state = "done"
+        except gbc.GenerationCancelled:
+            job.state = "cancelled"
+        except Exception as e:
+            logging.exception("Trabajo %s falló", job.id)
+            job.state, job.error = "error", str(e)
+        finally:
+            job.finished = time.time()
+            with self.lock:
+                self.running -= 1
+                self.counters[job.state] += 1
+                if job.state == "done": self.counters["labels"] += job.result["labels"]
+            self.run_hist.observe(job.finished - job.started)
+            if isinstance(job.source, Path):
+                try: os.remove(job.source)
+                except OSError: pass
+            job.source = None      # no retener el DataFrame
+            job.finished_ev.set()
+            if job.state == "cancelled": self._forget(job)
+            self._trim()
+
+    def _trim(self):
+        """Conserva solo los últimos `keep` trabajos terminados."""
+        with self.lock:
+            finished = sorted((j for j in self.jobs.values() if j.finished_ev.is_set()), key=lambda j: j.finished)
+            old = finished[:max(0, len(finished) - self.keep)]
+        for job in old: self._forget(job)
+
+    def metrics(self) -> str:
+        with self.lock:
+            c, running, depth = dict(self.counters), self.running, self.queue.qsize()
+        lines = ["# HELP etiquetas_cola Trabajos en espera", "# TYPE etiquetas_cola gauge", f"etiquetas_cola {depth}",
+                 "# HELP etiquetas_cola_max Capacidad de la cola", "# TYPE etiquetas_cola_max gauge",
+                 f"etiquetas_cola_max {self.queue.maxsize}",
+                 "# HELP etiquetas_en_curso Trabajos generándose", "# TYPE etiquetas_en_curso gauge",
+                 f"etiquetas_en_curso {running}",
+                 "# HELP etiquetas_trabajos_total Trabajos por resultado", "# TYPE etiquetas_trabajos_total counter"]
+        lines += [f'etiquetas_trabajos_total{{estado="{k}"}} {c[k]}'
+                  for k in ("submitted", "rejected", "done", "error", "cancelled")]
+        lines += ["# HELP etiquetas_generadas_total Etiquetas escritas", "# TYPE etiquetas_generadas_total counter",
+                  f"etiquetas_generadas_total {c['labels']}"]
+        lines += self.wait_hist.lines("etiquetas_espera_segundos", "Tiempo en cola hasta empezar")
+        lines += self.run_hist.lines("etiquetas_generacion_segundos", "Tiempo de generación por trabajo")
+        if self.cache is not None:
+            st = self.cache.stats()
+            lines += ["# TYPE etiquetas_cache_bloques_total counter",
+                      f'etiquetas_cache_bloques_total{{resultado="hit"}} {st["hits"]}',
+                      f'etiquetas_cache_bloques_total{{resultado="miss"}} {st["misses"]}',
+                      "# TYPE etiquetas_cache_bytes gauge", f"etiquetas_cache_bytes {st['bytes']}"]
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self):
+        for _ in self.threads: self.queue.put(None)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "EtiquetasPDF/1.0"
+    service: LabelService = None
+    max_upload = MAX_UPLOAD_MB_DEFAULT << 20
+
+    def log_message(self, fmt, *args):
+        logging.info("%s %s", self.address_string(), fmt % args)
+
+    def _json(self, code, payload, headers=()):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers: self.send_header(k, v)
+        self.end_headers(); self.wfile.write(data)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        return [p for p in url.path.split("/") if p], parse_qs(url.query)
+
+    def do_GET(self):
+        parts, q = self._route()
+        if parts == ["healthz"]: return self._json(200, {"ok": True})
+        if parts == ["metrics"]:
+            data = self.service.metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers(); self.wfile.write(data); return
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None: return self._json(404, {"error": "trabajo no encontrado"})
+            if len(parts) == 2: return self._json(200, job.status())
+            if parts[2:] == ["pdf"]: return self._send_pdf(job, q)
+            if parts[2:] == ["no_caben.csv"] and job.state == "done":
+                return self._send_file(gbc.fit_report_path(job.pdf), "text/csv; charset=utf-8")
+            if parts[2:] == ["codigos_rechazados.csv"] and job.state == "done":
+                return self._send_file(gbc.preflight_report_path(job.pdf), "text/csv; charset=utf-8")
+        self._json(404, {"error": "ruta no encontrada"})
+
+    def _send_pdf(self, job: Job, q):
+        try: wait = min(WAIT_MAX_S, _number(q.get("wait", ["0"])[-1], "wait"))
+        except JobError as e: return self._json(400, {"error": str(e)})
+        if wait > 0: job.finished_ev.wait(wait)
+        if job.state != "done":
+            return self._json(409 if job.state in ("queued", "running") else 410, job.status())
+        self._send_file(job.pdf, "application/pdf", f"etiquetas_{job.id}.pdf")
+
+    def _send_file(self, path, ctype, filename=None):
+        try: f = open(path, "rb")
+        except OSError: return self._json(404, {"error": "archivo no disponible"})
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            if filename: self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, 1 << 16)
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs" and self.service.cancel(parts[1]):
+            return self._json(200, {"id": parts[1], "status": "cancelled"})
+        self._json(404, {"error": "trabajo no encontrado"})
+
+    def do_POST(self):
+        parts, q = self._route()
+        if parts != ["jobs"]: return self._json(404, {"error": "ruta no encontrada"})
+        size = int(self.headers.get("Content-Length") or 0)
+        if size <= 0: return self._json(411, {"error": "falta el cuerpo (Content-Length)"})
+        if size > self.max_upload:
+            self.close_connection = True
+            return self._json(413, {"error": f"máximo {self.max_upload >> 20} MB por trabajo"})
+        # backpressure: rechazar antes de leer el cuerpo si la cola ya está llena
+        if self.service.queue.full():
+            with self.service.lock: self.service.counters["rejected"] += 1
+            self.close_connection = True
+            return self._json(429, {"error": "cola llena"}, [("Retry-After", str(self.service.retry_after()))])
+        body = self.rfile.read(size)
+        ctype = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        try:
+            if ctype == "application/json":
+                doc = json.loads(body)
+                if not isinstance(doc, dict): raise JobError('el cuerpo JSON debe ser un objeto {"records": [...]}')
+                options = parse_options(q, doc)
+                source = records_frame(doc.get("records"))
+            else:
+                options = parse_options(q)
+                fd, tmp = tempfile.mkstemp(suffix=UPLOAD_SUFFIXES.get(ctype, ".csv"), dir=self.service.data_dir)
+                with os.fdopen(fd, "wb") as f: f.write(body)
+                source = Path(tmp)
+            job = self.service.submit(source, options)
+        except (JobError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            return self._json(400, {"error": str(e)})
+        except queue.Full:
+            if isinstance(source, Path): os.remove(source)
+            return self._json(429, {"error": "cola llena"}, [("Retry-After", str(self.service.retry_after()))])
+        self._json(202, {"id": job.id, "status": job.state, "status_url": f"/jobs/{job.id}",
+                         "pdf_url": f"/jobs/{job.id}/pdf"}, [("Location", f"/jobs/{job.id}")])
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Servicio HTTP local de etiquetas 51×25 mm")
+    ap.add_argument("--host", default="127.0.0.1", help="0.0.0.0 para aceptar otras estaciones de la red")
+    ap.add_argument("--port", type=int, default=PORT_DEFAULT)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos del pool compartido")
+    ap.add_argument("--jobs", type=int, default=JOBS_DEFAULT, help="trabajos generándose a la vez")
+    ap.add_argument("--queue", type=int, default=QUEUE_DEFAULT, help="trabajos en espera antes de responder 429")
+    ap.add_argument("--max-mb", type=int, default=MAX_UPLOAD_MB_DEFAULT, help="tamaño máximo de un trabajo")
+    ap.add_argument("--keep", type=int, default=KEEP_DEFAULT, help="trabajos terminados que se conservan")
+    ap.add_argument("--data-dir", type=Path, help="PDFs y CSV recibidos (por defecto un temporal)")
+    ap.add_argument("--cache", type=Path, metavar="DIR", nargs="?", const=gbc.CACHE_DIR_DEFAULT,
+                    help="caché de etiquetas compartida entre trabajos (ver --cache del CLI)")
+    ap.add_argument("--cache-max-mb", type=int, default=gbc.CACHE_MAX_MB_DEFAULT)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s")
+
+    data_dir = args.data_dir or Path(tempfile.mkdtemp(prefix="etiquetas_srv_"))
+    cache = gbc.LabelCache(args.cache, args.cache_max_mb << 20) if args.cache else None
+    Handler.service = LabelService(data_dir, workers=args.workers, jobs=args.jobs, queue_size=args.queue,
+                                   keep=args.keep, cache=cache)
+    Handler.max_upload = args.max_mb << 20
+    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
+    httpd.daemon_threads = True
+    logging.info("Escuchando en http://%s:%d (pool de %d procesos, %d trabajos a la vez, cola %d, datos en %s)",
+                 args.host, args.port, args.workers, args.jobs, args.queue, data_dir)
+    try: httpd.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        httpd.server_close(); Handler.service.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())